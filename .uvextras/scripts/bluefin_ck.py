@@ -1,15 +1,12 @@
 
 import argparse
+import json
 import os
-import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Mapping
 
-from rich import box
-from rich.console import Console
-from rich.table import Table
-
 BFIN_PROBLEM_BINS = [
     'fastfetch',
     'fzf',
@@ -26,19 +23,25 @@ BFIN_PROBLEM_BINS = [
 
 LOCAL_BIN = Path('~/.local/bin').expanduser().resolve()
 
+# exported launchers are small shell scripts that mention distrobox-enter near the top - only the header of a file is
+# read, and files larger than a launcher could be (e.g., real binaries) are not read at all
+HEADER_SIZE = 4096
+MAX_LAUNCHER_SIZE = 64 * 1024
+
 
-def cmp_bin4exported(bin: Path, bins: list[str], is_bluefin: bool) -> Mapping[str, tuple[bool, bool, bool]]:
+def cmp_bin4exported(bin: Path, bins: list[str], is_bluefin: bool, jobs: int = 1) -> Mapping[str, tuple[bool, bool, bool]]:
     paths = {lbf for lbf in bin.iterdir() if lbf.is_file()}
     paths.update(LOCAL_BIN / name for name in BFIN_PROBLEM_BINS)
 
-    exported_apps = {
-        lbf.name: (
+    def check(lbf: Path) -> tuple[bool, bool, bool]:
+        return (
             is_bluefin and lbf.name in bins,
             lbf.exists(),
-            grep(lbf, 'distrobox-enter')
+            header_contains(lbf, b'distrobox-enter')
         )
-        for lbf in paths
-    }
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        exported_apps = dict(zip((lbf.name for lbf in paths), executor.map(check, paths)))
 
     return {
         k: exported_apps[k]
@@ -46,8 +49,16 @@ def cmp_bin4exported(bin: Path, bins: list[str], is_bluefin: bool) -> Mapping[st
     }
 
 
-def grep(path: Path, expr: str) -> bool:
-    return subprocess.call(f'grep {expr} {path} >/dev/null 2>&1', shell=True) == 0
+def header_contains(path: Path, expr: bytes) -> bool:
+    """Whether expr is in the first HEADER_SIZE bytes of path - False for missing, unreadable or large files"""
+    try:
+        if path.stat().st_size > MAX_LAUNCHER_SIZE:
+            return False
+
+        with open(path, 'rb') as f:
+            return expr in f.read(HEADER_SIZE)
+    except OSError:
+        return False
 
 
 def parse_args(args: list[str]) -> argparse.Namespace:
@@ -55,22 +66,37 @@ def parse_args(args: list[str]) -> argparse.Namespace:
     parser.add_argument('-a', '--all', default=False, action='store_true', help=f'List all files in {LOCAL_BIN}')
     parser.add_argument('-d', '--delete', default=False, action='store_true',
                         help=f'delete all files in {LOCAL_BIN} that might cause an problem if running on bluefin host')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='the number of files to check concurrently')
+    parser.add_argument('--json', default=False, action='store_true', help='print JSON instead of a table, e.g., for a login check')
     return parser.parse_args(args)
 
 
-def is_bluefin_host() -> bool:
-    file_path = Path('/etc/os-release')
+def os_release(file_path: Path = Path('/etc/os-release')) -> dict[str, str]:
+    """The KEY=value pairs of os-release(5), unquoted"""
+    try:
+        lines = file_path.read_text().splitlines()
+    except OSError:
+        return {}
 
-    return file_path.exists() and grep(file_path, 'bluefin')
+    release: dict[str, str] = {}
+    for line in lines:
+        key, sep, value = line.strip().partition('=')
+        if sep and not key.startswith('#'):
+            release[key] = value.strip().strip('"\'')
+    return release
 
 
-def main(args: list[str]) -> None:
-    ns = parse_args(args)
-    cli_all = ns.all
-    cli_delete = ns.delete
+def is_bluefin_host() -> bool:
+    return any('bluefin' in value for value in os_release().values())
+
+
+def print_table(tbl_data: Mapping[str, tuple[bool, bool, bool]], cli_all: bool, is_bluefin: bool) -> None:
+    # rich is only imported for the table; --json skips it to start faster
+    from rich import box
+    from rich.console import Console
+    from rich.table import Table
 
     console = Console()
-    is_bluefin = is_bluefin_host()
 
     table = Table(title=f'Bluefin Problematic Exported Binaries in {LOCAL_BIN}\n{is_bluefin=}', title_justify='left', show_lines=True, box=box.ROUNDED)
     table.add_column('Name')
@@ -78,10 +104,6 @@ def main(args: list[str]) -> None:
     table.add_column('Exists?', justify='center', style='bold green1')
     table.add_column('Exported?', justify='center', style='bold green1')
 
-    tbl_data = cmp_bin4exported(LOCAL_BIN, BFIN_PROBLEM_BINS, is_bluefin)
-
-    delete_files: list[str] = []
-
     for local_path, (problem, exists, exported) in tbl_data.items():
         if cli_all or problem:
             table.add_row(
@@ -90,13 +112,42 @@ def main(args: list[str]) -> None:
                 '+' if exists else '',
                 '+' if exported else '',
             )
-            if is_bluefin and cli_delete and exported and problem:
-                delete_files.append(local_path)
 
     console.print(table)
 
+
+def main(args: list[str]) -> None:
+    ns = parse_args(args)
+    cli_all = ns.all
+    cli_delete = ns.delete
+
+    is_bluefin = is_bluefin_host()
+
+    tbl_data = cmp_bin4exported(LOCAL_BIN, BFIN_PROBLEM_BINS, is_bluefin, jobs=ns.jobs)
+
+    delete_files: list[str] = [
+        str(LOCAL_BIN / local_path)
+        for local_path, (problem, exists, exported) in tbl_data.items()
+        if is_bluefin and cli_delete and exported and problem
+    ]
+
+    if ns.json:
+        print(json.dumps({
+            'local_bin': str(LOCAL_BIN),
+            'is_bluefin': is_bluefin,
+            'bins': [
+                {'name': name, 'problem': problem, 'exists': exists, 'exported': exported}
+                for name, (problem, exists, exported) in tbl_data.items()
+                if cli_all or problem
+            ],
+            'deleted': delete_files,
+        }, indent=2))
+    else:
+        print_table(tbl_data, cli_all=cli_all, is_bluefin=is_bluefin)
+
     for f in delete_files:
-        print(f'deleted {f}')
+        if not ns.json:
+            print(f'deleted {f}')
         os.unlink(f)
 
 
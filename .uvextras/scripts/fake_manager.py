@@ -0,0 +1,349 @@
+
+"""A stand-in for docker, podman and distrobox that keeps images and containers in a JSON state file.
+
+It answers the commands the ocisictl adapters run - ps, image ls, image inspect, image history, container inspect,
+buildx build, rmi, rm, stop, buildx prune, system prune, save, load, tag and distrobox assemble create - so ocisictl
+can be run (and benchmarked) end to end without a container manager. Install the executables in a directory and put
+it first in PATH:
+
+    python fake_manager.py install /tmp/fake-bin
+    PATH=/tmp/fake-bin:$PATH python -m ocisictl process -f ocisictl.yaml
+
+Configured with environment variables:
+
+    FAKE_MANAGER_STATE          the state directory (default: $XDG_RUNTIME_DIR or /tmp, /fake-manager)
+    FAKE_MANAGER_LATENCY        seconds every command takes (default: 0)
+    FAKE_MANAGER_BUILD_SECONDS  seconds a build or an assemble takes (default: 0.1)
+    FAKE_MANAGER_FAILURE_RATE   the fraction of builds and assembles that fail (default: 0)
+    FAKE_MANAGER_SEED           makes which images fail repeatable (default: 0)
+"""
+
+import configparser
+import fcntl
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+PROGS = ['docker', 'podman', 'distrobox']
+
+STATE_DIR = Path(os.getenv('FAKE_MANAGER_STATE') or Path(os.getenv('XDG_RUNTIME_DIR', '/tmp')) / 'fake-manager')
+LATENCY = float(os.getenv('FAKE_MANAGER_LATENCY', '0'))
+BUILD_SECONDS = float(os.getenv('FAKE_MANAGER_BUILD_SECONDS', '0.1'))
+FAILURE_RATE = float(os.getenv('FAKE_MANAGER_FAILURE_RATE', '0'))
+SEED = os.getenv('FAKE_MANAGER_SEED', '0')
+
+# the layer an image FROM an unknown (e.g., registry) image starts with
+BASE_LAYER_SIZE = 100_000_000
+
+State = dict[str, Any]
+
+
+def digest(text: str) -> str:
+    return 'sha256:' + hashlib.sha256(text.encode()).hexdigest()
+
+
+def fails(what: str) -> bool:
+    """Whether building or assembling what fails - the same for the same seed, so benchmark runs are comparable"""
+    return FAILURE_RATE > 0 and random.Random(f'{SEED}:{what}').random() < FAILURE_RATE
+
+
+def normalize(ref: str) -> str:
+    for prefix in ('localhost/', 'docker.io/library/'):
+        ref = ref.removeprefix(prefix)
+    return ref if ':' in ref.rpartition('/')[2] else f'{ref}:latest'
+
+
+def find_image(store: State, ref: str) -> Optional[dict[str, Any]]:
+    if img := store['images'].get(normalize(ref)):
+        return img
+    prefix = ref.removeprefix('sha256:')
+    return next((img for img in store['images'].values() if img['id'].removeprefix('sha256:').startswith(prefix)), None)
+
+
+def option(args: list[str], name: str) -> Optional[str]:
+    return args[args.index(name) + 1] if name in args else None
+
+
+def options(args: list[str], name: str) -> dict[str, str]:
+    return dict(args[i + 1].split('=', 1) for i, arg in enumerate(args[:-1]) if arg == name)
+
+
+def operands(args: list[str], with_values: tuple[str, ...] = ()) -> list[str]:
+    """The args that are not options - or the values of the options in with_values"""
+    found: list[str] = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in with_values:
+            skip = True
+        elif not arg.startswith('-'):
+            found.append(arg)
+    return found
+
+
+def ps(prog: str, store: State, args: list[str]) -> None:
+    listed = [(name, c) for name, c in store['containers'].items() if c['state'] == 'running' or '-a' in args]
+    if prog == 'podman':
+        print(json.dumps([{'Id': c['id'], 'Names': [name], 'Image': c['image'], 'State': c['state']} for name, c in listed]))
+    else:
+        for name, c in listed:
+            print(json.dumps({'ID': c['id'], 'Names': name, 'Image': c['image'], 'State': c['state']}))
+
+
+def image_ls(prog: str, store: State) -> None:
+    if prog == 'podman':
+        print(json.dumps([
+            {'Id': img['id'], 'Names': [f'localhost/{name}'], 'Size': img['size'], 'CreatedAt': img['created'], 'Labels': img['labels']}
+            for name, img in store['images'].items()
+        ]))
+    else:
+        for name, img in store['images'].items():
+            repo, _, tag = name.rpartition(':')
+            print(json.dumps({'ID': img['id'][7:19], 'Repository': repo, 'Tag': tag, 'Size': f'{img["size"] / 1e6:.1f}MB', 'CreatedAt': img['created']}))
+
+
+def image_inspect(store: State, refs: list[str]) -> int:
+    recs: list[dict[str, Any]] = []
+    rc = 0
+    for ref in refs:
+        if not (img := find_image(store, ref)):
+            print(f'Error: no such image: {ref}', file=sys.stderr)
+            rc = 1
+            continue
+        recs.append({
+            'Id': img['id'],
+            'RepoTags': [name for name, other in store['images'].items() if other is img],
+            'Size': img['size'],
+            'Created': img['created'],
+            'RootFS': {'Layers': [layer for layer, _ in img['layers']]},
+            'Config': {'Labels': img['labels']},
+        })
+    print(json.dumps(recs))
+    return rc
+
+
+def image_history(prog: str, store: State, ref: str) -> int:
+    if not (img := find_image(store, ref)):
+        print(f'Error: no such image: {ref}', file=sys.stderr)
+        return 1
+
+    recs = [{'id': '<missing>', 'size': size, 'created_by': 'RUN'} for _, size in reversed(img['layers'])]
+    if prog == 'podman':
+        print(json.dumps(recs))
+    else:
+        for rec in recs:
+            print(json.dumps({'ID': rec['id'], 'Size': str(rec['size']), 'CreatedBy': rec['created_by']}))
+    return 0
+
+
+def build(store: State, args: list[str]) -> int:
+    """Make up the layers of the image: those of its FROM image and one per RUN instruction"""
+    tag = normalize(option(args, '-t') or '')
+    text = Path(option(args, '-f') or 'Containerfile').read_text()
+    build_args = options(args, '--build-arg')
+
+    if cache_to := option(args, '--cache-to'):
+        dest = Path(dict(kv.split('=', 1) for kv in cache_to.split(','))['dest'])
+        dest.mkdir(parents=True, exist_ok=True)
+        (dest / 'index.json').write_text('{}')
+
+    instructions = [line for line in text.splitlines() if re.match(r'[A-Z]+ ', line)]
+    for i, instruction in enumerate(instructions, 1):
+        print(f'STEP {i}/{len(instructions)}: {instruction}')
+
+    if fails(tag):
+        print(f'Error: building {tag}: simulated failure', file=sys.stderr)
+        return 1
+
+    rng = random.Random(f'{SEED}:{tag}:{time.time()}')
+    arg_values: dict[str, str] = {}
+    layers: list[tuple[str, int]] = []
+    for line in text.splitlines():
+        if m := re.match(r'ARG (\w+)(?:="?([^"]*)"?)?', line):
+            arg_values[m.group(1)] = build_args.get(m.group(1), m.group(2) or '')
+        elif m := re.match(r'FROM (\S+)', line):
+            ref = re.sub(r'\$\{?(\w+)\}?', lambda v: arg_values.get(v.group(1), ''), m.group(1))
+            parent = store['images'].get(normalize(ref))
+            layers = list(parent['layers']) if parent else [(digest(ref), BASE_LAYER_SIZE)]
+        elif line.startswith('RUN'):
+            layers.append((digest(f'{tag}{line}{rng.random()}'), rng.randint(1, 50) * 1_000_000))
+
+    store['images'][tag] = {
+        'id': digest(f'{tag}{time.time()}'),
+        'layers': layers,
+        'labels': options(args, '--label'),
+        'size': sum(size for _, size in layers),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    return 0
+
+
+def rmi(store: State, refs: list[str]) -> int:
+    for ref in refs:
+        if store['images'].pop(normalize(ref), None):
+            print(f'Untagged: {ref}')
+        else:
+            print(f'Error: no such image: {ref}', file=sys.stderr)
+    return 0
+
+
+def save(store: State, ref: str) -> int:
+    """Write the image to stdout - as JSON rather than a tar archive, which only load reads"""
+    if not (img := find_image(store, ref)):
+        print(f'Error: no such image: {ref}', file=sys.stderr)
+        return 1
+
+    json.dump({'names': [normalize(ref)], 'image': img}, sys.stdout)
+    return 0
+
+
+def load(store: State, stdin: str) -> int:
+    archive = json.loads(stdin)
+    for name in archive['names']:
+        store['images'][name] = archive['image']
+        print(f'Loaded image: {name}')
+    return 0
+
+
+def tag(store: State, ref: str, name: str) -> int:
+    if not (img := find_image(store, ref)):
+        print(f'Error: no such image: {ref}', file=sys.stderr)
+        return 1
+
+    store['images'][normalize(name)] = img
+    return 0
+
+
+def rm_or_stop(store: State, verb: str, names: list[str]) -> int:
+    for name in names:
+        c = store['containers'].get(name) or next((c for c in store['containers'].values() if c['id'] == name), None)
+        if not c:
+            print(f'Error: no such container: {name}', file=sys.stderr)
+            continue
+
+        if verb == 'rm':
+            store['containers'] = {k: v for k, v in store['containers'].items() if v is not c}
+        else:
+            c['state'] = 'exited'
+        print(name)
+    return 0
+
+
+def assemble_image(name: str) -> str:
+    """The image of the distrobox name in the distrobox.ini of the working directory - the name itself if it has none"""
+    ini = configparser.ConfigParser(interpolation=None)
+    ini.read('distrobox.ini')
+    return ini.get(name, 'image', fallback=name)
+
+
+def distrobox(state: State, args: list[str]) -> int:
+    if args[:2] != ['assemble', 'create']:
+        return 0
+
+    name = option(args, '--name') or ''
+    time.sleep(BUILD_SECONDS)
+    if fails(name):
+        print(f'Error: assembling {name}: simulated failure', file=sys.stderr)
+        return 1
+
+    store = state.setdefault(os.getenv('DBX_CONTAINER_MANAGER', 'podman'), {'images': {}, 'containers': {}})
+    store['containers'][name] = {'id': digest(f'{name}{time.time()}')[7:19], 'image': assemble_image(name), 'state': 'running'}
+    return 0
+
+
+def manager(prog: str, store: State, args: list[str], stdin: str = '') -> int:
+    verb = args[0] if args else ''
+
+    if verb == 'ps':
+        ps(prog, store, args)
+    elif args[:2] == ['image', 'ls']:
+        image_ls(prog, store)
+    elif args[:2] == ['image', 'inspect'] or verb == 'inspect':
+        return image_inspect(store, operands(args[2 if verb == 'image' else 1:], with_values=('--format',)))
+    elif args[:2] == ['image', 'history'] or verb == 'history':
+        return image_history(prog, store, args[-1])
+    elif args[:2] == ['container', 'inspect']:
+        if not (c := store['containers'].get(args[-1])):
+            return 1
+        print(c['id'])
+    elif args[:2] == ['buildx', 'build'] or verb == 'build':
+        return build(store, args)
+    elif verb == 'rmi':
+        return rmi(store, operands(args[1:]))
+    elif verb == 'save':
+        return save(store, args[-1])
+    elif verb == 'load':
+        return load(store, stdin)
+    elif verb == 'tag':
+        return tag(store, args[-2], args[-1])
+    elif verb in ('rm', 'stop'):
+        return rm_or_stop(store, verb, operands(args[1:], with_values=('-t', '--time', '--timeout')))
+    elif args[:2] == ['system', 'prune']:
+        store['images'] = {}
+        print('Total reclaimed space: 0B')
+    elif args[:2] == ['buildx', 'prune']:
+        print('Total reclaimed space: 0B')
+
+    return 0
+
+
+def run(prog: str, args: list[str]) -> int:
+    time.sleep(LATENCY)
+    if args[:2] == ['buildx', 'build'] or args[:1] == ['build']:
+        time.sleep(BUILD_SECONDS)  # outside the lock, so concurrent builds overlap as they would for real
+
+    # read before taking the lock - the save writing to stdin holds it until its output is read
+    stdin = sys.stdin.read() if args[:1] == ['load'] else ''
+
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    state_file = STATE_DIR / 'state.json'
+
+    with open(STATE_DIR / 'state.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        state: State = json.loads(state_file.read_text()) if state_file.exists() else {}
+        with open(STATE_DIR / 'commands.log', 'a') as log:
+            log.write(f'{time.time():.3f} {prog} {" ".join(args)}\n')
+
+        if prog == 'distrobox':
+            rc = distrobox(state, args)
+        else:
+            rc = manager(prog, state.setdefault(prog, {'images': {}, 'containers': {}}), args, stdin=stdin)
+
+        tmp = state_file.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state))
+        tmp.replace(state_file)
+
+    return rc
+
+
+def install(bin_dir: Path) -> None:
+    """Write a docker, podman and distrobox executable to bin_dir that run this script"""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for prog in PROGS:
+        exe = bin_dir / prog
+        exe.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{Path(__file__).resolve()}" {prog} "$@"\n')
+        exe.chmod(0o755)
+
+
+def main(args: list[str]) -> int:
+    if args[:1] == ['install'] and len(args) == 2:
+        install(Path(args[1]))
+        return 0
+
+    if not args or args[0] not in PROGS:
+        print(f'usage: {Path(sys.argv[0]).name} install BIN_DIR | {{{",".join(PROGS)}}} ARGS...', file=sys.stderr)
+        return 2
+
+    return run(args[0], args[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
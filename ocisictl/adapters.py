@@ -1,57 +1,347 @@
 """Adapter classes and functions used by steps"""
 
 
+import logging
+import os
+import re
+from datetime import UTC, datetime
 from pathlib import Path
-from ocisictl.utils import cmd_output_to_terminal, cmd_with_output
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from ocisictl.models import ContainerInfo, ImageInfo
+from ocisictl.utils import (
+    cmd_capture,
+    cmd_json,
+    cmd_output_prefixed,
+    cmd_output_to_terminal,
+    cmd_pipe,
+    cmd_with_output,
+    for_each_concurrently,
+    parse_size,
+    write_text_atomic
+)
+
+if TYPE_CHECKING:
+    # imported by use_engine_api - http.client takes a while to import and most runs do not use the API
+    from ocisictl.engine_api import EngineApiClient
 
 # _CM_OPTS = 'BUILDKIT_PROGRESS=plain '
 _CM_OPTS = ''
 
+# where distrobox-export writes the launchers of exported binaries, and the bytes of a file read to recognize one
+DISTROBOX_EXPORT_PATH = Path('~/.local/bin')
+_LAUNCHER_HEADER_SIZE = 512
 
-def container_remove(manager: str, name: str, verbose: bool) -> None:
-    cmd_output_to_terminal(cmd=f'{manager} rm -f --volumes {name}', verbose=verbose)
+# keep each inspect command line well below ARG_MAX
+_INSPECT_CHUNK_SIZE = 200
 
+# managers whose adapters talk to the Engine API instead of running the manager CLI; see use_engine_api
+_api_clients: dict[str, EngineApiClient] = {}
 
-def container_stop(manager: str, name: str, verbose: bool) -> None:
-    cmd_output_to_terminal(cmd=f'{manager} stop {name}', verbose=verbose)
 
+def _api_client(manager: str) -> Optional[EngineApiClient]:
+    return _api_clients.get(manager)
 
-def containers_running(manager: str, verbose: bool) -> list[str]:
-    idkey = '.ID'
 
-    if manager == 'podman':
-        idkey = '.[].Id'
+def _api_failed(manager: str, e: Exception) -> None:
+    """Stop using the API of manager - adapters call this for any OSError, which includes EngineApiError"""
+    logging.warning(f'{manager} API call failed ({e!r}); falling back to the {manager} CLI')
+    _api_clients.pop(manager, None)
 
-    return cmd_with_output(cmd=f'{manager} ps --format json | yq -p=j {idkey} | sed "/---/d"', verbose=verbose).splitlines()
 
+def _mentions(line: str, name: str) -> bool:
+    """Whether line names name as a whole reference - fedora-go is not mentioned by an error about fedora-go-dx:latest"""
+    return re.search(rf'(?<![\w./:@-]){re.escape(name)}(?![\w./@-])', line) is not None
 
-def image_build(manager: str, container_file: str, image_name: str, build_args: str, verbose: bool) -> None:
-    cmd_output_to_terminal(
-        cmd=f'{_CM_OPTS}{manager} buildx build -f {container_file} -t {image_name} {build_args} .', verbose=verbose
+
+def _batch(
+    manager: str, args: list[str], names: list[str], verbose: bool, recheck: Callable[[list[str]], dict[str, bool]]
+) -> dict[str, bool]:
+    """Run one manager command for all names; a name failed if the manager complained about it on stderr.
+
+    When the command fails, the names stderr does not mention are passed to recheck, which returns whether the command
+    took effect for each one - the managers do not always name what they failed on.
+    """
+    if not names:
+        return {}
+
+    proc = cmd_capture(args=[manager, *args, *names], verbose=verbose)
+    if proc.returncode == 0:
+        return dict.fromkeys(names, True)
+
+    errors = proc.stderr.splitlines()
+    for line in errors:
+        logging.debug(f'{manager} {args[0]}: {line}')
+
+    results = {name: False for name in names if any(_mentions(line, name) for line in errors)}
+    if unattributed := [name for name in names if name not in results]:
+        results |= recheck(unattributed)
+
+    return {name: results[name] for name in names}
+
+
+def _batch_api(client: EngineApiClient, call: Callable[[str], bool], names: list[str]) -> dict[str, bool]:
+    return for_each_concurrently(names, call, max_workers=client.pool_size) if names else {}
+
+
+def container_exists(manager: str, name: str, verbose: bool) -> bool:
+    if client := _api_client(manager):
+        try:
+            return client.container_inspect(name) is not None
+        except OSError as e:
+            _api_failed(manager, e)
+
+    return bool(cmd_with_output(cmd=f'{manager} container inspect --format "{{{{.Id}}}}" {name}', verbose=verbose, check=False).strip())
+
+
+def containers_remove(manager: str, names: list[str], verbose: bool) -> dict[str, bool]:
+    """Force remove the containers (and their volumes); returns whether each one was removed"""
+    if client := _api_client(manager):
+        try:
+            return _batch_api(client, client.container_remove, names)
+        except OSError as e:
+            _api_failed(manager, e)
+
+    def removed(names: list[str]) -> dict[str, bool]:
+        return {name: not container_exists(manager=manager, name=name, verbose=verbose) for name in names}
+
+    return _batch(manager=manager, args=['rm', '-f', '--volumes'], names=names, verbose=verbose, recheck=removed)
+
+
+def containers_stop(manager: str, names: list[str], timeout: int, verbose: bool) -> dict[str, bool]:
+    """Stop the containers concurrently, killing any still running after timeout seconds; returns whether each stopped"""
+    if client := _api_client(manager):
+        try:
+            return _batch_api(client, lambda name: client.container_stop(name, timeout=timeout), names)
+        except OSError as e:
+            _api_failed(manager, e)
+
+    def stopped(names: list[str]) -> dict[str, bool]:
+        running = {ref for c in containers_running(manager=manager, verbose=verbose) for ref in [c.id, *c.names]}
+        return {name: name not in running for name in names}
+
+    return _batch(manager=manager, args=['stop', '-t', str(timeout)], names=names, verbose=verbose, recheck=stopped)
+
+
+def container_info_from_ps(rec: dict[str, Any]) -> ContainerInfo:
+    # docker emits one object per line with Names as a comma separated string; podman and the API emit a Names list
+    names = rec.get('Names') or []
+    if isinstance(names, str):
+        names = names.split(',')
+
+    return ContainerInfo(
+        id=rec.get('ID') or rec.get('Id', ''),
+        names=[name.lstrip('/') for name in names],
+        image=rec.get('Image', ''),
+        state=rec.get('State', ''),
+    )
+
+
+def containers_all(manager: str, verbose: bool) -> list[ContainerInfo]:
+    """Every container - running or not, e.g., a distrobox that is not entered"""
+    if client := _api_client(manager):
+        try:
+            return [container_info_from_ps(rec) for rec in client.containers_all()]
+        except OSError as e:
+            _api_failed(manager, e)
+
+    return [container_info_from_ps(rec) for rec in cmd_json(args=[manager, 'ps', '-a', '--format', 'json'], verbose=verbose)]
+
+
+def containers_running(manager: str, verbose: bool) -> list[ContainerInfo]:
+    if client := _api_client(manager):
+        try:
+            return [container_info_from_ps(rec) for rec in client.containers_running()]
+        except OSError as e:
+            _api_failed(manager, e)
+
+    return [container_info_from_ps(rec) for rec in cmd_json(args=[manager, 'ps', '--format', 'json'], verbose=verbose)]
+
+
+def image_build(
+    manager: str,
+    container_file: str,
+    image_name: str,
+    build_args: dict[str, str],
+    labels: dict[str, str],
+    context_dir: str,
+    verbose: bool,
+    cache_from: Optional[str] = None,
+    cache_to: Optional[str] = None,
+    log_file: Optional[Path] = None,
+    progress: bool = False,
+) -> int:
+    bargs = ' '.join(f'--build-arg {k}={v}' for k, v in build_args.items())
+    bargs += ''.join(f' --label {k}={v}' for k, v in labels.items())
+    bargs += f' --cache-from {cache_from}' if cache_from else ''
+    # exporting the cache takes a docker-container builder, whose result only reaches the image store with --load
+    bargs += f' --cache-to {cache_to} --load' if cache_to else ''
+    return cmd_output_prefixed(
+        cmd=f'{_CM_OPTS}{manager} buildx build -f {container_file} -t {image_name} {bargs} .',
+        prefix=image_name,
+        verbose=verbose,
+        cwd=context_dir,
+        log_file=log_file,
+        progress=progress,
+    )
+
+
+def image_copy(source: str, target: str, image_name: str, verbose: bool) -> bool:
+    """Stream image_name from the store of source to that of target (save | load) and tag it image_name there"""
+    if cmd_pipe(src_args=[source, 'save', image_name], dst_args=[target, 'load'], verbose=verbose) != 0:
+        return False
+
+    if image_inspect(manager=target, image_name=image_name, verbose=verbose):
+        return True
+
+    # podman saves localhost/name:tag, which docker loads as is
+    loaded = f'localhost/{image_name}'
+    return cmd_output_to_terminal(cmd=f'{target} tag {loaded} {image_name}', verbose=verbose) == 0
+
+
+def image_id(manager: str, image_name: str, verbose: bool) -> Optional[str]:
+    info = image_inspect(manager=manager, image_name=image_name, verbose=verbose)
+    return info.id if info else None
+
+
+def image_info_from_inspect(rec: dict[str, Any]) -> ImageInfo:
+    return ImageInfo(
+        id=rec.get('Id', ''),
+        names=rec.get('RepoTags') or [],
+        size=rec.get('Size') or 0,
+        created=rec.get('Created') or '',
+        layers=(rec.get('RootFS') or {}).get('Layers') or [],
+        labels=(rec.get('Config') or {}).get('Labels') or {},
     )
 
 
-def image_names(manager: str, verbose: bool) -> list[str]:
-    cmd = ''
+def image_inspect(manager: str, image_name: str, verbose: bool) -> Optional[ImageInfo]:
+    infos = images_inspect(manager=manager, image_names=[image_name], verbose=verbose)
+    return infos[0] if infos else None
+
+
+def image_label(manager: str, image_name: str, label: str, verbose: bool) -> Optional[str]:
+    info = image_inspect(manager=manager, image_name=image_name, verbose=verbose)
+    return info.labels.get(label) if info else None
+
+
+def images_remove(manager: str, image_names: list[str], verbose: bool) -> dict[str, bool]:
+    """Force remove the images; returns whether each one was removed"""
+    if client := _api_client(manager):
+        try:
+            return _batch_api(client, client.image_remove, image_names)
+        except OSError as e:
+            _api_failed(manager, e)
+
+    def removed(names: list[str]) -> dict[str, bool]:
+        return {name: image_id(manager=manager, image_name=name, verbose=verbose) is None for name in names}
+
+    return _batch(manager=manager, args=['rmi', '-f'], names=image_names, verbose=verbose, recheck=removed)
+
+
+def images_inspect(manager: str, image_names: list[str], verbose: bool) -> list[ImageInfo]:
+    """Inspect many images with one manager call per chunk of names; names that do not exist are left out"""
+    if client := _api_client(manager):
+        try:
+            return [image_info_from_inspect(rec) for name in image_names if (rec := client.image_inspect(name))]
+        except OSError as e:
+            _api_failed(manager, e)
+
+    infos: list[ImageInfo] = []
+
+    for i in range(0, len(image_names), _INSPECT_CHUNK_SIZE):
+        chunk = image_names[i:i + _INSPECT_CHUNK_SIZE]
+        infos.extend(image_info_from_inspect(rec) for rec in cmd_json(args=[manager, 'image', 'inspect', *chunk], verbose=verbose))
+
+    return infos
+
+
+def image_layer_sizes(manager: str, image_name: str, layers: list[str], verbose: bool) -> dict[str, int]:
+    """Map the layers of image_name to their size using its history; {} if history cannot be matched up with layers"""
+    recs = cmd_json(args=[manager, 'image', 'history', '--no-trunc', '--human=false', '--format', 'json', image_name], verbose=verbose)
+
+    # history is newest first; docker reports Size as a string, podman as an int named size
+    sizes: list[int] = []
+    for rec in reversed(recs):
+        size = rec.get('Size', rec.get('size', 0))
+        sizes.append(parse_size(size) if isinstance(size, str) else size)
+
+    if len(sizes) != len(layers):
+        # entries for instructions that did not produce a layer (ENV, LABEL, ...) are empty
+        sizes = [size for size in sizes if size > 0]
+
+    if len(sizes) != len(layers):
+        logging.debug(f'{manager} - {image_name}: cannot match {len(sizes)} history entries to {len(layers)} layers')
+        return {}
+
+    return dict(zip(layers, sizes))
+
+
+def image_list(manager: str, verbose: bool) -> list[ImageInfo]:
+    """The named (tagged) images in the store of manager sorted by name"""
+    if client := _api_client(manager):
+        try:
+            return sorted(
+                (
+                    ImageInfo(
+                        id=rec.get('Id', ''),
+                        names=tags,
+                        size=rec.get('Size') or 0,
+                        created=datetime.fromtimestamp(rec.get('Created') or 0, UTC).isoformat(),
+                        labels=rec.get('Labels') or {},
+                    )
+                    for rec in client.image_list()
+                    if (tags := [t for t in rec.get('RepoTags') or [] if t != '<none>:<none>'])
+                ),
+                key=lambda img: img.name,
+            )
+        except OSError as e:
+            _api_failed(manager, e)
+
+    recs = cmd_json(args=[manager, 'image', 'ls', '--format', 'json'], verbose=verbose)
+    imgs: list[ImageInfo] = []
+
     if manager == 'docker':
-        cmd = f'{manager} image ls --format json | yq -p=j \'select(.Repository != "<none>") | (.Repository + ":" + .Tag)\' | sed \'/---/d;/^:$/d\' | sort'  # noqa E501
+        # one object per repository:tag with a human readable Size
+        imgs = [
+            ImageInfo(
+                id=rec.get('ID', ''),
+                names=[f'{rec["Repository"]}:{rec.get("Tag", "latest")}'],
+                size=parse_size(rec.get('Size') or '0'),
+                created=rec.get('CreatedAt', ''),
+            )
+            for rec in recs
+            if rec.get('Repository', '<none>') != '<none>'
+        ]
     elif manager == 'podman':
-        cmd = f'{manager} image ls --format json | yq -p=j ".[] | select(.Names != null) | .Names[0]" | sed "/---/d" | sort'
-    else:
-        # unsupported manager
-        return []
+        imgs = [
+            ImageInfo(
+                id=rec.get('Id', ''),
+                names=rec['Names'],
+                size=rec.get('Size') or 0,
+                created=rec.get('CreatedAt', ''),
+                labels=rec.get('Labels') or {},
+            )
+            for rec in recs
+            if rec.get('Names')
+        ]
+
+    return sorted(imgs, key=lambda img: img.name)
 
-    imgs_names = sorted(cmd_with_output(cmd=cmd, verbose=verbose).splitlines())
-    return imgs_names
 
+def use_engine_api(manager: str, socket_path: Optional[str] = None) -> bool:
+    """Route the container and image adapters of manager through its Engine API socket; the CLI is the fallback"""
+    from ocisictl.engine_api import EngineApiClient, default_socket_path
 
-def image_remove(manager: str, image_name: str, verbose: bool) -> None:
-    cmd_output_to_terminal(cmd=f'{manager} rmi -f {image_name}', verbose=verbose)
+    client = EngineApiClient(socket_path or default_socket_path(manager))
 
+    if not client.ping():
+        logging.warning(f'{manager} API is not reachable at {client.socket_path}; using the {manager} CLI')
+        return False
 
-def list_image_layers(manager: str, image_name: str, verbose: bool) -> None:
-    cmd = f'echo "\n{manager} - {image_name}";{manager} inspect --format json {image_name} | yq -p=j .[0].RootFS.Layers'
-    cmd_output_to_terminal(cmd=cmd, verbose=verbose)
+    logging.info(f'Using the {manager} API at {client.socket_path}')
+    _api_clients[manager] = client
+    return True
 
 
 def prune_buildx(manager: str, verbose: bool) -> None:
@@ -63,43 +353,76 @@ def prune_system(manager: str, verbose: bool) -> None:
     cmd_output_to_terminal(cmd=f'{manager} system prune -af --volumes {cm_opts}', verbose=verbose)
 
 
-def distrobox_assemble(manager: str, name: str, verbose: bool) -> None:
-    cmd_output_to_terminal(
+def distrobox_assemble(
+    manager: str, name: str, verbose: bool, log_file: Optional[Path] = None, progress: bool = False
+) -> int:
+    return cmd_output_prefixed(
         cmd=f'DBX_CONTAINER_ALWAYS_PULL=0 DBX_CONTAINER_MANAGER={manager} distrobox assemble create --replace --name {name}',
+        prefix=name,
         verbose=verbose,
+        log_file=log_file,
+        progress=progress,
     )
 
 
-def distrobox_assemble_fixup_bin(manager: str, bin: str) -> None:
-    pbin = Path(bin)
-    if text := pbin.read_text():
-        lines_with_cm: list[str] = []
-        lines = text.splitlines()
+def distrobox_assemble_fixup_bin(manager: str, bin: Path) -> bool:
+    """Prefix the distrobox-enter command of the launcher bin with DBX_CONTAINER_MANAGER; returns whether it changed"""
+    text = bin.read_text()
+    lines_with_cm: list[str] = []
 
-        for line in lines:
-            if 'distrobox-enter' in line and 'DBX_CONTAINER_MANAGER=' not in line:
-                line = f'\tDBX_CONTAINER_MANAGER={manager} {line.strip()}'
+    for line in text.splitlines(keepends=True):
+        if 'distrobox-enter' in line and 'DBX_CONTAINER_MANAGER=' not in line:
+            eol = '\n' if line.endswith('\n') else ''
+            line = f'\tDBX_CONTAINER_MANAGER={manager} {line.strip()}{eol}'
 
-            lines_with_cm.append(line)
+        lines_with_cm.append(line)
 
-        text = '\n'.join(lines_with_cm)
-        pbin.write_text(text)
+    fixed = ''.join(lines_with_cm)
+    if fixed == text:
+        return False
 
+    write_text_atomic(bin, fixed)
+    return True
 
-def distrobox_assemble_fixup_bins(manager: str, name: str, verbose: bool) -> None:
-    for bin in distrobox_export_bins_list(manager=manager, name=name, verbose=verbose):
-        print(f'{bin}: {manager} {name}')
-        distrobox_assemble_fixup_bin(manager=manager, bin=bin)
 
+def distrobox_assemble_fixup_bins(manager: str, name: str) -> None:
+    bins = distrobox_exported_bins(name=name)
 
-def distrobox_export_bins_list(manager: str, name: str, verbose: bool) -> list[str]:
-    out = cmd_with_output(
-        cmd=f'DBX_CONTAINER_ALWAYS_PULL=0 DBX_CONTAINER_MANAGER={manager} distrobox enter {name} -- distrobox-export --list-binaries',
-        verbose=verbose,
-    )
-    lines = out.splitlines()
-    bins = [
-        line.partition('|')[2].strip()
-        for line in lines
-    ]
-    return bins
+    fixed = 0
+    for bin in bins:
+        if distrobox_assemble_fixup_bin(manager=manager, bin=bin):
+            logging.info(f'{name} | {bin}: {manager}')
+            fixed += 1
+
+    logging.debug(f'{name} | fixed {fixed} of {len(bins)} exported binaries')
+
+
+def distrobox_exported_bins(name: str, export_path: Path = DISTROBOX_EXPORT_PATH) -> list[Path]:
+    """The launchers distrobox-export wrote in export_path for the binaries of the distrobox name.
+
+    Like distrobox-export --list-binaries, launchers are recognized by their header (# distrobox_binary and # name: ...)
+    - but read on the host, so the container is not started just to list them. Only the header of each file is read.
+    """
+    expanded = export_path.expanduser()
+    if not expanded.is_dir():
+        return []
+
+    name_line = f'# name: {name}'.encode()
+    bins: list[Path] = []
+
+    with os.scandir(expanded) as entries:
+        for entry in entries:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+
+            try:
+                with open(entry.path, 'rb') as f:
+                    header = f.read(_LAUNCHER_HEADER_SIZE).splitlines()
+            except OSError as e:
+                logging.debug(f'{entry.path}: {e!r}')
+                continue
+
+            if b'# distrobox_binary' in header and name_line in header:
+                bins.append(Path(entry.path))
+
+    return sorted(bins)
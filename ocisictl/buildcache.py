@@ -0,0 +1,75 @@
+"""A local BuildKit cache directory per image - it is not touched by buildx / system prune, so builds stay warm"""
+
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+
+def _entry(cache_dir: str, image_name: str) -> Path:
+    return Path(cache_dir) / image_name.replace('/', '_').replace(':', '_')
+
+
+def _size(path: Path) -> int:
+    return sum(
+        (Path(root) / f).stat().st_size for root, _, files in os.walk(path) for f in files if not (Path(root) / f).is_symlink()
+    )
+
+
+def cache_options(manager: str, cache_dir: str, image_name: str) -> tuple[Optional[str], Optional[str]]:
+    """The --cache-from and --cache-to values to build image_name with; (None, None) if manager cannot use the cache.
+
+    The cache is exported to a new directory which replaces the current one (see commit_cache), as the local exporter
+    never removes blobs that are no longer referenced.
+    """
+    if manager != 'docker':
+        # podman build only imports / exports cache from / to a registry repository
+        logging.info(f'{manager} does not support a local build cache; not using {cache_dir} for {image_name}')
+        return None, None
+
+    entry = _entry(cache_dir, image_name)
+    cache_from = f'type=local,src={entry}' if (entry / 'index.json').exists() else None
+    return cache_from, f'type=local,dest={entry}.new,mode=max'
+
+
+def commit_cache(cache_dir: str, image_name: str) -> None:
+    """Replace the cache of image_name with the one exported by its build - which also marks it as recently used"""
+    entry = _entry(cache_dir, image_name)
+    new = entry.with_name(f'{entry.name}.new')
+    if not new.is_dir():
+        return
+
+    old = entry.with_name(f'{entry.name}.old')
+    shutil.rmtree(old, ignore_errors=True)
+    if entry.exists():
+        entry.rename(old)
+    new.rename(entry)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def discard_cache(cache_dir: str, image_name: str) -> None:
+    """Remove a partial export left by a failed build"""
+    entry = _entry(cache_dir, image_name)
+    shutil.rmtree(entry.with_name(f'{entry.name}.new'), ignore_errors=True)
+
+
+def evict_cache(cache_dir: str, max_bytes: int) -> list[str]:
+    """Remove the least recently used cache entries until the cache fits in max_bytes; returns the entries removed"""
+    root = Path(cache_dir)
+    if not root.is_dir():
+        return []
+
+    entries = sorted((p for p in root.iterdir() if p.is_dir()), key=lambda p: p.stat().st_mtime)
+    sizes = {p: _size(p) for p in entries}
+    total = sum(sizes.values())
+
+    evicted: list[str] = []
+    for p in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(p, ignore_errors=True)
+        total -= sizes[p]
+        evicted.append(p.name)
+
+    return evicted
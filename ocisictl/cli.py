@@ -3,6 +3,7 @@
 import argparse
 
 from ocisictl.models import AppContext
+from ocisictl.utils import parse_size
 
 
 def parse_args(args: list[str]) -> AppContext:
@@ -10,38 +11,129 @@ def parse_args(args: list[str]) -> AppContext:
 
     parser = argparse.ArgumentParser()
 
-    verbs = parser.add_subparsers(title='verbs', required=True, dest='verb', metavar='(list | process | clean)')
+    # the options shared by verbs - each verb lists the parents it takes them from
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        '--api', action='append', choices=['docker', 'podman'], metavar='MANAGER',
+        help='use the Engine API socket of MANAGER instead of its CLI where possible; may be repeated'
+    )
+    common.add_argument('-f', '--file', default=config_file, metavar='FILE', help='configuration FILE')
+    common.add_argument('-v', '--verbose', default=False, action='store_true', help='enable verbose output')
+
+    build = argparse.ArgumentParser(add_help=False)
+    build.add_argument('--assemble-jobs', default=4, type=int, metavar='N', help='assemble up to N distroboxes concurrently')
+    build.add_argument('-j', '--jobs', default=1, type=int, metavar='N', help='build up to N independent images concurrently')
+    build.add_argument(
+        '--progress', default=False, action='store_true', help='only show the progress lines (e.g., STEP 3/10) of builds and assembles'
+    )
+
+    build_cache = argparse.ArgumentParser(add_help=False)
+    build_cache.add_argument(
+        '--cache-dir', metavar='DIR', help='import and export the BuildKit cache of each image (docker only) in DIR, which pruning keeps'
+    )
+    build_cache.add_argument(
+        '--cache-max-bytes', default='20G', type=parse_size, metavar='SIZE',
+        help='evict the least recently used entries of --cache-dir beyond SIZE (e.g., 20G) when pruning or cleaning'
+    )
+
+    run_output = argparse.ArgumentParser(add_help=False)
+    run_output.add_argument(
+        '--metrics', metavar='FILE',
+        help='write metrics of the run to FILE in the Prometheus text format for the node_exporter textfile collector (JSON if FILE ends with .json)'
+    )
+    run_output.add_argument('--trace', metavar='FILE', help='write a Chrome trace (JSON) of the steps and commands of the run to FILE')
+
+    verbs = parser.add_subparsers(title='verbs', required=True, dest='verb', metavar='(list | process | clean | gc | lint | sync | watch)')
 
     ls_desc = 'List information about the configuration or the system'
-    ls = verbs.add_parser('list', description=ls_desc, help=ls_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    ls = verbs.add_parser(
+        'list', parents=[common], description=ls_desc, help=ls_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
     meg = ls.add_mutually_exclusive_group(required=True)
     meg.add_argument('--all', default=False, action='store_true', help='list all images containers')
     meg.add_argument('-a', '--assemble', default=False, action='store_true', help='list containers to assemble')
     meg.add_argument('-e', '--enabled', default=False, action='store_true', help='list images to create')
+    meg.add_argument('--history', default=False, action='store_true', help='list build history trends of images')
     meg.add_argument('-l', '--layers', default=False, action='store_true', help='list layers of images')
-
-    ls.add_argument('-f', '--file', default=config_file, metavar='FILE', help='configuration FILE')
-    ls.add_argument('-v', '--verbose', default=False, action='store_true', help='enable verbose output')
+    meg.add_argument('-s', '--sharing', default=False, action='store_true', help='report bytes saved by layer sharing')
 
     proc_desc = 'Create images / assemble containers'
     proc = verbs.add_parser(
-        'process', description=proc_desc, help=proc_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        'process', parents=[common, build, build_cache, run_output], description=proc_desc, help=proc_desc,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    proc.add_argument(
+        '--force', default=False, action='store_true', help='rebuild all images even if their build fingerprint is unchanged'
+    )
+    proc.add_argument(
+        '--log-dir', metavar='DIR', help='write the output of each build and assemble to its own file in a new directory under DIR'
+    )
+    proc.add_argument(
+        '--plan', default=False, action='store_true', help='only show what would be done, with estimates of its duration and disk use'
     )
-    proc.add_argument('-f', '--file', default=config_file, metavar='FILE', help='configuration FILE')
     proc.add_argument(
         '-p', '--prune', default=False, action='store_true', help='stop containers and perform system pruning before starting; if --podman is not set skip it'
     )
+    proc.add_argument(
+        '--resume', default=False, action='store_true',
+        help='continue the last run if it failed - skipping the steps it completed whose images are unchanged'
+    )
+    proc.add_argument(
+        '--ready-timeout', default=60.0, type=float, metavar='SECONDS', help='how long to wait for built images to be ready before assembling'
+    )
     proc.add_argument('--skip_podman', default=False, action='store_true', help='skip clean up buildx artifacts for podman after done')
+    proc.add_argument(
+        '--stop-timeout', default=2, type=int, metavar='SECONDS', help='seconds to wait for containers to stop before killing them'
+    )
     proc.add_argument('-s', '--skip-clean', default=False, action='store_true', help='skip the clean up artifacts step after done')
-    proc.add_argument('-v', '--verbose', default=False, action='store_true', help='enable verbose output')
 
     clean_desc = 'Clean up images'
     clean = verbs.add_parser(
-        'clean', description=clean_desc, help=clean_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        'clean', parents=[common, build_cache, run_output], description=clean_desc, help=clean_desc,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
-    clean.add_argument('-f', '--file', default=config_file, metavar='FILE', help='configuration FILE')
     clean.add_argument('--skip_podman', default=False, action='store_true', help='skip clean up buildx artifacts for podman after done')
-    clean.add_argument('-v', '--verbose', default=False, action='store_true', help='enable verbose output')
+
+    gc_desc = 'Evict the least recently used images until the images fit in a disk budget'
+    gc = verbs.add_parser(
+        'gc', parents=[common], description=gc_desc, help=gc_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    gc.add_argument('-n', '--dry-run', default=False, action='store_true', help='show the images that would be evicted')
+    gc.add_argument(
+        '--max-bytes', required=True, type=parse_size, metavar='SIZE',
+        help='disk budget (e.g., 40G) for the unique layer bytes of the images of all managers'
+    )
+
+    lint_desc = 'Check the Containerfiles of the configured images'
+    lint = verbs.add_parser(
+        'lint', parents=[common], description=lint_desc, help=lint_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    lmeg = lint.add_mutually_exclusive_group(required=True)
+    lmeg.add_argument(
+        '--sharing', default=False, action='store_true',
+        help='find RUN commands that images built FROM the same parent repeat - candidates to run in the parent instead'
+    )
+
+    lint.add_argument(
+        '--threshold', default=0.8, type=float, metavar='RATIO', help='how similar (0-1) two commands must be to be near-duplicates'
+    )
+
+    sync_desc = 'Copy the images with sync_to to the store of that manager (e.g., docker save | podman load)'
+    sync = verbs.add_parser(
+        'sync', parents=[common, run_output], description=sync_desc, help=sync_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    watch_desc = 'Rebuild the images affected by changes to their directories and reassemble their containers'
+    watch = verbs.add_parser(
+        'watch', parents=[common, build], description=watch_desc, help=watch_desc, formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    watch.add_argument(
+        '--debounce', default=2.0, type=float, metavar='SECONDS', help='wait until nothing has changed for SECONDS before rebuilding'
+    )
+    watch.add_argument(
+        '--poll-interval', default=1.0, type=float, metavar='SECONDS', help='how often to check for changes if inotify is not available'
+    )
+    watch.set_defaults(prune=False, skip_clean=True)
 
     pargs = parser.parse_args(args=args)
 
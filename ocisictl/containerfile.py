@@ -0,0 +1,120 @@
+"""Minimal Containerfile parsing - just enough to discover how images relate to each other"""
+
+import json
+import re
+import shlex
+from pathlib import Path
+from typing import Optional
+
+_ARG_RE = re.compile(r'^ARG\s+(\w+)(?:=(.*))?$', re.IGNORECASE)
+_FROM_RE = re.compile(r'^FROM\s+(?:--\S+\s+)*(\S+)(?:\s+AS\s+(\S+))?', re.IGNORECASE)
+_VAR_RE = re.compile(r'\$\{?(\w+)\}?')
+
+
+def instructions(text: str) -> list[str]:
+    """Return the logical instructions in text - comments dropped and continuation lines joined"""
+    instrs: list[str] = []
+    current: list[str] = []
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith('#')):
+            continue
+        if current and stripped.startswith('#'):
+            continue
+
+        if stripped.endswith('\\'):
+            current.append(stripped.removesuffix('\\').strip())
+            continue
+
+        current.append(stripped)
+        instrs.append(' '.join(part for part in current if part))
+        current = []
+
+    if current:
+        instrs.append(' '.join(part for part in current if part))
+
+    return instrs
+
+
+def normalize_image_ref(ref: str) -> str:
+    """Normalize an image reference so that FROM lines can be matched against ContainerImage.full_image_name"""
+    for prefix in ('localhost/', 'docker.io/library/'):
+        ref = ref.removeprefix(prefix)
+
+    if '@' not in ref and ':' not in ref.rpartition('/')[2]:
+        ref = f'{ref}:latest'
+
+    return ref
+
+
+def substitute(text: str, args: dict[str, str]) -> str:
+    return _VAR_RE.sub(lambda m: args.get(m.group(1), m.group(0)), text)
+
+
+def parent_refs(container_file: Path, build_args: dict[str, str]) -> list[str]:
+    """The (normalized) external images named by the FROM lines of container_file"""
+    args: dict[str, str] = {}
+    stages: set[str] = set()
+    parents: list[str] = []
+
+    for instr in instructions(container_file.read_text()):
+        if m := _ARG_RE.match(instr):
+            name, default = m.group(1), (m.group(2) or '').strip().strip('"\'')
+            args[name] = build_args.get(name, substitute(default, args))
+        elif m := _FROM_RE.match(instr):
+            ref = substitute(m.group(1), args)
+            if ref not in stages and ref != 'scratch':
+                parents.append(normalize_image_ref(ref))
+            if m.group(2):
+                stages.add(m.group(2))
+
+    return parents
+
+
+def final_stage(container_file: Path, build_args: dict[str, str]) -> tuple[Optional[str], list[str]]:
+    """The image named by the last FROM line of container_file and the instructions that follow it, args substituted"""
+    args: dict[str, str] = {}
+    parent: Optional[str] = None
+    instrs: list[str] = []
+
+    for instr in instructions(container_file.read_text()):
+        if m := _ARG_RE.match(instr):
+            name, default = m.group(1), (m.group(2) or '').strip().strip('"\'')
+            args[name] = build_args.get(name, substitute(default, args))
+        elif m := _FROM_RE.match(instr):
+            parent, instrs = substitute(m.group(1), args), []
+        else:
+            instrs.append(substitute(instr, args))
+
+    return parent, instrs
+
+
+def copy_sources(container_file: Path, build_args: dict[str, str]) -> list[str]:
+    """The build context paths copied in by the COPY / ADD instructions of container_file"""
+    args: dict[str, str] = {}
+    sources: list[str] = []
+
+    for instr in instructions(container_file.read_text()):
+        if m := _ARG_RE.match(instr):
+            name, default = m.group(1), (m.group(2) or '').strip().strip('"\'')
+            args[name] = build_args.get(name, substitute(default, args))
+            continue
+
+        keyword, _, rest = instr.partition(' ')
+        if keyword.upper() not in ('COPY', 'ADD'):
+            continue
+
+        rest = substitute(rest, args).strip()
+        if rest.startswith('['):
+            parts = json.loads(rest)
+        else:
+            parts = shlex.split(rest)
+
+        if any(p.startswith('--from') for p in parts):
+            continue  # copied from another stage or image, not the build context
+
+        paths = [p for p in parts if not p.startswith('--')]
+        sources.extend(p for p in paths[:-1] if '://' not in p)
+
+    return sources
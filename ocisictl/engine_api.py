@@ -0,0 +1,140 @@
+"""A minimal Docker Engine API client - also works with the docker compatible API of podman
+
+A small pool of persistent HTTP connections over the local unix socket of the daemon is reused for every call, which
+avoids paying for a shell, the manager CLI and a new daemon connection per operation.
+"""
+
+import http.client
+import json
+import logging
+import os
+import queue
+import socket
+from typing import Any, Optional
+from urllib.parse import quote, urlencode
+
+from ocisictl.trace import span
+
+
+class EngineApiError(OSError):
+    """The daemon answered a request with an error status - an OSError like failing to reach the daemon at all"""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float) -> None:
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def default_socket_path(manager: str) -> str:
+    if manager == 'podman':
+        if runtime_dir := os.getenv('XDG_RUNTIME_DIR'):
+            return f'{runtime_dir}/podman/podman.sock'
+        return '/run/podman/podman.sock'
+
+    if (host := os.getenv('DOCKER_HOST', '')).startswith('unix://'):
+        return host.removeprefix('unix://')
+    return '/var/run/docker.sock'
+
+
+class EngineApiClient:
+    """Talks to a container daemon over a pool of persistent connections - pool_size calls can be in flight at once"""
+
+    def __init__(self, socket_path: str, timeout: float = 60.0, pool_size: int = 4) -> None:
+        self.socket_path = socket_path
+        self.pool_size = pool_size
+        self._pool: queue.Queue[UnixHTTPConnection] = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(UnixHTTPConnection(socket_path, timeout=timeout))
+
+    def close(self) -> None:
+        for _ in range(self.pool_size):
+            self._pool.get().close()
+
+    def request(
+        self, method: str, path: str, query: Optional[dict[str, Any]] = None, ok: tuple[int, ...] = ()
+    ) -> tuple[int, Any]:
+        """Send a request and return its status and body - decoded if JSON, None if empty; statuses in ok are not errors"""
+        url = f'{path}?{urlencode(query)}' if query else path
+
+        conn = self._pool.get()
+        try:
+            with span(f'{method} {path}', cat='api') as s:
+                for attempt in (1, 2):
+                    try:
+                        conn.request(method, url, headers={'Content-Type': 'application/json'})
+                        resp = conn.getresponse()
+                        body = resp.read()
+                        break
+                    except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                        # the daemon closed the idle keep-alive connection - reconnect once
+                        conn.close()
+                        if attempt == 2:
+                            raise
+                s.tags['status'] = resp.status
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            self._pool.put(conn)
+
+        if resp.status >= 400 and resp.status not in ok:
+            try:
+                message = json.loads(body).get('message', '')
+            except ValueError:
+                message = body.decode(errors='replace')
+            raise EngineApiError(resp.status, message)
+
+        data: Any = None
+        if body.strip():
+            data = json.loads(body) if 'json' in (resp.getheader('Content-Type') or '') else body.decode(errors='replace')
+
+        return resp.status, data
+
+    def ping(self) -> bool:
+        try:
+            self.request('GET', '/_ping')
+            return True
+        except (OSError, EngineApiError, ValueError) as e:
+            logging.debug(f'{self.socket_path}: {e!r}')
+            return False
+
+    def container_inspect(self, name: str) -> Optional[dict[str, Any]]:
+        status, rec = self.request('GET', f'/containers/{quote(name, safe="")}/json', ok=(404,))
+        return rec if status == 200 else None
+
+    def container_remove(self, name: str) -> bool:
+        status, _ = self.request('DELETE', f'/containers/{quote(name, safe="")}', query={'force': 'true', 'v': 'true'}, ok=(404,))
+        return status < 300
+
+    def container_stop(self, name: str, timeout: Optional[int] = None) -> bool:
+        query = {'t': timeout} if timeout is not None else None
+        status, _ = self.request('POST', f'/containers/{quote(name, safe="")}/stop', query=query, ok=(304, 404))
+        return status in (204, 304)
+
+    def containers_all(self) -> list[dict[str, Any]]:
+        return self.request('GET', '/containers/json', query={'all': 'true'})[1] or []
+
+    def containers_running(self) -> list[dict[str, Any]]:
+        return self.request('GET', '/containers/json')[1] or []
+
+    def image_inspect(self, name: str) -> Optional[dict[str, Any]]:
+        status, rec = self.request('GET', f'/images/{quote(name, safe="/:@")}/json', ok=(404,))
+        return rec if status == 200 else None
+
+    def image_list(self) -> list[dict[str, Any]]:
+        return self.request('GET', '/images/json')[1] or []
+
+    def image_remove(self, name: str) -> bool:
+        status, _ = self.request('DELETE', f'/images/{quote(name, safe="/:@")}', query={'force': 'true'}, ok=(404, 409))
+        return status == 200
@@ -0,0 +1,46 @@
+"""Build fingerprints - a content hash of everything that goes into building an image"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Callable, Optional
+
+from ocisictl.containerfile import copy_sources, parent_refs
+from ocisictl.models import ContainerImage
+
+FINGERPRINT_LABEL = 'ocisictl.fingerprint'
+
+
+def _hash_path(h: 'hashlib._Hash', context_dir: Path, path: Path) -> None:
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+
+    for f in files:
+        h.update(str(f.relative_to(context_dir)).encode())
+        h.update(f.read_bytes())
+
+
+def fingerprint(image: ContainerImage, parent_digest: Callable[[str], Optional[str]]) -> str:
+    """Hash the Containerfile, build args, parent image digests and copied in files of image.
+
+    parent_digest maps an image reference to the digest of that image in the store - None if it is not present or not
+    built from the config (e.g., quay.io/fedora/fedora:43), in which case only the reference is hashed. An external
+    base may not be pulled until the build runs, and is not re-pulled once present, so its digest would change the
+    fingerprint without anything having changed.
+    """
+    context_dir = Path(image.path)
+    container_file = image.container_file_path
+    build_args = image.build_args()
+
+    h = hashlib.sha256()
+    h.update(container_file.read_bytes())
+    h.update(json.dumps(build_args, sort_keys=True).encode())
+
+    for ref in parent_refs(container_file, build_args):
+        h.update(f'{ref}={parent_digest(ref) or ""}'.encode())
+
+    for src in copy_sources(container_file, build_args):
+        path = context_dir / src
+        for p in [path] if path.exists() else sorted(context_dir.glob(src)):
+            _hash_path(h, context_dir, p)
+
+    return f'sha256:{h.hexdigest()}'
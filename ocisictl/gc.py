@@ -0,0 +1,77 @@
+"""Disk budget garbage collection - evict the least recently used images until the unique layer bytes fit a budget"""
+
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from ocisictl.containerfile import normalize_image_ref
+from ocisictl.models import ImageInfo
+from ocisictl.sharing import SharingReport
+
+
+@dataclass
+class Eviction:
+    """An image to remove and the bytes that removing it reclaims - given the evictions before it"""
+
+    manager: str
+    image: ImageInfo
+    last_used: float
+    reclaimed: int
+
+
+def created_timestamp(created: str) -> float:
+    """The time an image was created as reported by inspect (e.g., 2025-01-31T12:34:56.123456789Z); 0 if unknown"""
+    try:
+        return datetime.fromisoformat(created[:19]).replace(tzinfo=UTC).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def image_refs(img: ImageInfo) -> set[str]:
+    """Every way the image may be referred to - its normalized names and its id"""
+    return {normalize_image_ref(name) for name in img.names} | {img.id, img.short_id}
+
+
+def plan_gc(
+    reports: list[SharingReport], protected: dict[str, set[str]], last_used: dict[str, float], max_bytes: int
+) -> list[Eviction]:
+    """Choose the images to evict so that the bytes on disk of all reports fit in max_bytes.
+
+    Images are evicted least recently used first; last_used maps image names to a time which, when later, replaces the
+    time an image was created. Images whose refs are in protected (per manager) are never evicted, and images that
+    would reclaim nothing - e.g., a base image whose layers are all used by its children - are not removed either.
+    """
+    total = sum(report.unique_bytes for report in reports)
+    if total <= max_bytes:
+        return []
+
+    users: dict[tuple[str, str], set[str]] = {}
+    candidates: list[tuple[float, str, ImageInfo]] = []
+    for report in reports:
+        for digest, lu in report.layers.items():
+            users[(report.manager, digest)] = set(lu.images)
+
+        for img in report.images:
+            if image_refs(img) & protected.get(report.manager, set()):
+                continue
+            used = max([created_timestamp(img.created), *(last_used.get(normalize_image_ref(n), 0.0) for n in img.names)])
+            candidates.append((used, report.manager, img))
+
+    sizes = {(report.manager, digest): lu.size for report in reports for digest, lu in report.layers.items()}
+    evictions: list[Eviction] = []
+
+    for used, manager, img in sorted(candidates, key=lambda c: (c[0], c[2].name)):
+        if total <= max_bytes:
+            break
+
+        layers = [(manager, digest) for digest in dict.fromkeys(img.layers)]
+        reclaimed = sum(sizes[lyr] for lyr in layers if users[lyr] == {img.name})
+        if reclaimed == 0:
+            continue
+
+        for lyr in layers:
+            users[lyr].discard(img.name)
+
+        total -= reclaimed
+        evictions.append(Eviction(manager=manager, image=img, last_used=used, reclaimed=reclaimed))
+
+    return evictions
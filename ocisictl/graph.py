@@ -0,0 +1,165 @@
+"""The image dependency graph and a scheduler to build it concurrently"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+from ocisictl.containerfile import normalize_image_ref, parent_refs
+from ocisictl.models import ContainerImage
+
+
+@dataclass
+class ImageGraph:
+    """A DAG of images keyed by full_image_name - edges come from FROM lines and the -dx to base relationship"""
+
+    images: list[ContainerImage]
+    parents: dict[str, list[str]]
+
+    def ancestors(self, names: Iterable[str]) -> set[str]:
+        found: set[str] = set()
+        todo = list(names)
+
+        while todo:
+            name = todo.pop()
+            for parent in self.parents.get(name, []):
+                if parent not in found:
+                    found.add(parent)
+                    todo.append(parent)
+
+        return found
+
+    def children(self, name: str) -> list[str]:
+        return [ci.full_image_name for ci in self.images if name in self.parents[ci.full_image_name]]
+
+    def critical_paths(self, cost: Callable[[str], float]) -> dict[str, float]:
+        """The cost of the longest chain from each image down through its descendants - itself included"""
+        paths: dict[str, float] = {}
+
+        for level in reversed(self.levels()):
+            for ci in level:
+                name = ci.full_image_name
+                paths[name] = cost(name) + max((paths[child] for child in self.children(name)), default=0.0)
+
+        return paths
+
+    def descendants(self, names: Iterable[str]) -> set[str]:
+        found: set[str] = set()
+        todo = list(names)
+
+        while todo:
+            name = todo.pop()
+            for child in self.children(name):
+                if child not in found:
+                    found.add(child)
+                    todo.append(child)
+
+        return found
+
+    def image(self, name: str) -> ContainerImage:
+        return next(ci for ci in self.images if ci.full_image_name == name)
+
+    def levels(self) -> list[list[ContainerImage]]:
+        """Group images so that every image only depends on images in earlier levels"""
+        level_of: dict[str, int] = {}
+
+        def level(name: str, seen: tuple[str, ...] = ()) -> int:
+            if name in seen:
+                raise ValueError(f'dependency cycle detected: {" -> ".join((*seen, name))}')
+            if name not in level_of:
+                level_of[name] = 1 + max((level(p, (*seen, name)) for p in self.parents[name]), default=-1)
+            return level_of[name]
+
+        lvls: list[list[ContainerImage]] = []
+        for ci in self.images:
+            n = level(ci.full_image_name)
+            while len(lvls) <= n:
+                lvls.append([])
+            lvls[n].append(ci)
+
+        return lvls
+
+    @staticmethod
+    def from_images(images: list[ContainerImage]) -> ImageGraph:  # noqa F821
+        names = {ci.full_image_name for ci in images}
+        parents: dict[str, list[str]] = {}
+
+        for ci in images:
+            refs: list[str] = []
+
+            if ci.container_file_path.exists():
+                refs = parent_refs(ci.container_file_path, ci.build_args())
+            else:
+                logging.warning(f'{ci.container_file_path} not found; cannot determine the parents of {ci.full_image_name}')
+
+            if ci.base_image_name:
+                refs.append(normalize_image_ref(ci.base_image_name))
+
+            parents[ci.full_image_name] = [
+                ref
+                for ref in dict.fromkeys(refs)
+                if ref in names and ref != ci.full_image_name
+            ]
+
+        graph = ImageGraph(images=images, parents=parents)
+        graph.levels()  # fail fast on cycles
+
+        return graph
+
+
+def run_graph(
+    graph: ImageGraph,
+    work: Callable[[ContainerImage], bool],
+    jobs: int = 1,
+    slot: Callable[[ContainerImage], str] = lambda ci: '',
+    priority: Callable[[ContainerImage], float] = lambda ci: 0.0,
+) -> dict[str, bool]:
+    """Call work for every image in graph once all of its parents have succeeded.
+
+    At most jobs images run at a time per slot - e.g., per manager, as managers do not contend for the same store.
+    Ready images with the highest priority (e.g., the longest critical path) start first; ties are broken by config
+    order, so jobs=1 without priorities processes images of a slot exactly as listed in the config file.
+    Images whose parents failed are not attempted. Returns the success of each image by full_image_name.
+    """
+    jobs = max(jobs, 1)
+    slots = {slot(ci) for ci in graph.images}
+    results: dict[str, bool] = {}
+    pending = sorted(graph.images, key=priority, reverse=True)  # stable - config order among equal priorities
+    running: dict[Future[bool], ContainerImage] = {}
+
+    def slot_full(ci: ContainerImage) -> bool:
+        return sum(1 for r in running.values() if slot(r) == slot(ci)) >= jobs
+
+    def schedule(pool: ThreadPoolExecutor) -> None:
+        changed = True
+        while changed:
+            changed = False
+            for ci in list(pending):
+                parents = graph.parents[ci.full_image_name]
+
+                if any(results.get(p) is False for p in parents):
+                    logging.error(f'Skipping {ci.full_image_name} because a parent image failed: {parents}')
+                    results[ci.full_image_name] = False
+                    pending.remove(ci)
+                    changed = True
+                elif not slot_full(ci) and all(results.get(p) for p in parents):
+                    running[pool.submit(work, ci)] = ci
+                    pending.remove(ci)
+
+    with ThreadPoolExecutor(max_workers=jobs * max(len(slots), 1), thread_name_prefix='build') as pool:
+        schedule(pool)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                ci = running.pop(future)
+                try:
+                    results[ci.full_image_name] = future.result()
+                except Exception:
+                    logging.exception(f'{ci.full_image_name} failed')
+                    results[ci.full_image_name] = False
+
+            schedule(pool)
+
+    return results
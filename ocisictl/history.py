@@ -0,0 +1,156 @@
+"""Build history - a small SQLite database of how long images take to build, how often they are up to date and their size"""
+
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+# builds considered when estimating the duration of the next build of an image
+ESTIMATE_WINDOW = 5
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS builds (
+    id INTEGER PRIMARY KEY,
+    image TEXT NOT NULL,
+    manager TEXT NOT NULL,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    cached INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS builds_image ON builds (image, started);
+'''
+
+
+def default_history_path() -> Path:
+    state_home = os.getenv('XDG_STATE_HOME') or Path.home() / '.local' / 'state'
+    return Path(state_home) / 'ocisictl' / 'history.db'
+
+
+@dataclass
+class BuildRecord:
+    """The outcome of processing one image in one run - cached means its fingerprint was unchanged, so it was not built"""
+
+    image: str
+    manager: str
+    started: float
+    duration: float
+    cached: bool
+    ok: bool
+    size: Optional[int] = None
+
+
+@dataclass
+class ImageTrend:
+    """The build history of an image summarized"""
+
+    image: str
+    manager: str
+    runs: int
+    builds: int
+    cache_hits: int
+    last_run: float
+    last_duration: Optional[float]
+    avg_duration: Optional[float]
+    last_size: Optional[int]
+    first_size: Optional[int]
+
+    @property
+    def cache_hit_rate(self) -> float:
+        return self.cache_hits / self.runs if self.runs else 0.0
+
+    @property
+    def size_change(self) -> Optional[int]:
+        return self.last_size - self.first_size if self.last_size is not None and self.first_size is not None else None
+
+
+class BuildHistory:
+    """The history database; safe to record into from the build threads"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def estimates(self) -> dict[str, float]:
+        """The expected build duration of each image - the mean of its last ESTIMATE_WINDOW successful builds"""
+        with self._lock:
+            rows = self._conn.execute(
+                '''
+                SELECT image, AVG(duration) FROM (
+                    SELECT image, duration, ROW_NUMBER() OVER (PARTITION BY image ORDER BY started DESC) AS n
+                    FROM builds WHERE ok AND NOT cached
+                ) WHERE n <= ? GROUP BY image
+                ''',
+                (ESTIMATE_WINDOW,),
+            ).fetchall()
+
+        return dict(rows)
+
+    def record(self, records: list[BuildRecord]) -> None:
+        """Add records; failing to write history is logged, it never fails a run"""
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    'INSERT INTO builds (image, manager, started, duration, cached, ok, size) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(r.image, r.manager, r.started, r.duration, r.cached, r.ok, r.size) for r in records],
+                )
+        except sqlite3.Error as e:
+            logging.warning(f'Could not record build history in {self.path}: {e!r}')
+
+    def trends(self) -> list[ImageTrend]:
+        """Summarize the runs of every image in the history"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT image, manager, started, duration, cached, ok, size FROM builds ORDER BY image, started'
+            ).fetchall()
+
+        by_image: dict[str, list[BuildRecord]] = {}
+        for image, manager, started, duration, cached, ok, size in rows:
+            by_image.setdefault(image, []).append(
+                BuildRecord(image, manager, started, duration, cached=bool(cached), ok=bool(ok), size=size)
+            )
+
+        trends: list[ImageTrend] = []
+        for image, recs in by_image.items():
+            built = [r for r in recs if r.ok and not r.cached]
+            recent = built[-ESTIMATE_WINDOW:]
+            sizes = [r.size for r in recs if r.size is not None]
+
+            trends.append(
+                ImageTrend(
+                    image=image,
+                    manager=recs[-1].manager,
+                    runs=len(recs),
+                    builds=len(built),
+                    cache_hits=sum(1 for r in recs if r.cached),
+                    last_run=recs[-1].started,
+                    last_duration=built[-1].duration if built else None,
+                    avg_duration=sum(r.duration for r in recent) / len(recent) if recent else None,
+                    last_size=sizes[-1] if sizes else None,
+                    first_size=sizes[0] if sizes else None,
+                )
+            )
+
+        return trends
+
+
+def open_history(path: Optional[Path] = None) -> Optional[BuildHistory]:
+    """Open (creating if needed) the history database; None, with a warning, if that is not possible"""
+    path = path or default_history_path()
+
+    try:
+        return BuildHistory(path)
+    except (OSError, sqlite3.Error) as e:
+        logging.warning(f'Build history is not available - {path}: {e!r}')
+        return None
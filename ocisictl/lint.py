@@ -0,0 +1,104 @@
+"""Containerfile lint - RUN commands that sibling images repeat, which would be shared if their parent ran them instead"""
+
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Optional
+
+from ocisictl.containerfile import final_stage
+
+# commands of a RUN instruction - RUN a && b; c runs a, b and c
+_COMMAND_SEP_RE = re.compile(r'\s*(?:&&|;)\s*')
+_COMMENT_RE = re.compile(r'\s+#.*$')
+
+# the instructions that add a layer to the image
+_LAYER_KEYWORDS = ('ADD', 'COPY', 'RUN')
+
+
+@dataclass
+class RunCommand:
+    """A command of a RUN instruction of an image; layer is the index of the layer the instruction adds to the image"""
+
+    image: str
+    command: str
+    layer: int
+    size: Optional[int] = None  # of the layer - which the other commands of the instruction add to as well
+
+
+@dataclass
+class HoistCandidate:
+    """A command (or near-duplicates of it) that sibling images run, which their parent could run once instead"""
+
+    parent: str
+    commands: list[RunCommand] = field(default_factory=list)
+    similarity: float = 1.0  # of the least similar command to the first; 1.0 when they are identical
+
+    @property
+    def command(self) -> str:
+        return self.commands[0].command
+
+    @property
+    def images(self) -> list[str]:
+        return [rc.image for rc in self.commands]
+
+    @property
+    def bytes_saved(self) -> Optional[int]:
+        """At most what hoisting saves on disk - the command adds no more than the smallest layer it is part of, once
+        to the parent instead of once per sibling; None unless the size of each of those layers is known"""
+        sizes = [rc.size for rc in self.commands if rc.size is not None]
+        return min(sizes) * (len(sizes) - 1) if len(sizes) == len(self.commands) else None
+
+    def seconds_saved(self, estimates: dict[str, float]) -> Optional[float]:
+        """At most the build time hoisting saves - the command runs no longer than the quickest sibling build"""
+        durations = [estimates[img] for img in self.images if img in estimates]
+        return min(durations) * (len(durations) - 1) if len(durations) == len(self.commands) else None
+
+
+def run_commands(
+    image: str, container_file: Path, build_args: dict[str, str]
+) -> tuple[Optional[str], list[RunCommand], int]:
+    """The image of the last FROM line of container_file, the commands of the RUN instructions that follow it and the
+    number of layers those instructions (and COPY / ADD) add to the image"""
+    parent, instrs = final_stage(container_file, build_args)
+    commands: list[RunCommand] = []
+    layer = 0
+
+    for instr in instrs:
+        keyword, _, rest = instr.partition(' ')
+        if keyword.upper() not in _LAYER_KEYWORDS:
+            continue
+
+        if keyword.upper() == 'RUN':
+            for command in _COMMAND_SEP_RE.split(_COMMENT_RE.sub('', rest.strip())):
+                if command := ' '.join(command.split()):
+                    commands.append(RunCommand(image=image, command=command, layer=layer))
+
+        layer += 1
+
+    return parent, commands, layer
+
+
+def similarity(a: str, b: str) -> float:
+    """How alike two commands are, word by word - 1.0 when they are the same"""
+    return 1.0 if a == b else SequenceMatcher(None, a.split(), b.split()).ratio()
+
+
+def hoist_candidates(siblings: dict[str, list[RunCommand]], parent: str, threshold: float) -> list[HoistCandidate]:
+    """Group the commands of siblings (images built FROM parent) that at least 2 of them run - or run a variant of that
+    is at least threshold similar. Each command joins the first group it is similar enough to."""
+    groups: list[HoistCandidate] = []
+
+    for commands in siblings.values():
+        for rc in commands:
+            for group in groups:
+                if rc.image in group.images:
+                    continue
+                if (ratio := similarity(group.command, rc.command)) >= threshold:
+                    group.commands.append(rc)
+                    group.similarity = min(group.similarity, ratio)
+                    break
+            else:
+                groups.append(HoistCandidate(parent=parent, commands=[rc]))
+
+    return [group for group in groups if len(group.commands) > 1]
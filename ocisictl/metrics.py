@@ -0,0 +1,135 @@
+"""Run metrics in the Prometheus text format - for the textfile collector of node_exporter - derived from the trace"""
+
+import json
+import re
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from ocisictl.sharing import SharingReport
+from ocisictl.trace import Span
+
+# name: (type, help)
+METRICS = {
+    'ocisictl_build_duration_seconds': ('gauge', 'How long building the image took in the last run that built it'),
+    'ocisictl_build_success': ('gauge', 'Whether the last build of the image succeeded'),
+    'ocisictl_assemble_duration_seconds': ('gauge', 'How long assembling the distrobox took in the last run that assembled it'),
+    'ocisictl_image_size_bytes': ('gauge', 'The size of the image - including the layers it shares'),
+    'ocisictl_image_unique_bytes': ('gauge', 'The bytes of the layers of the image that no other image uses'),
+    'ocisictl_store_bytes': ('gauge', 'The bytes of the layers of all images in the store of the manager - each counted once'),
+    'ocisictl_reclaimed_bytes': ('gauge', 'The image bytes the prune or clean step of the last run reclaimed'),
+    'ocisictl_failures': ('gauge', 'The steps of the last run that failed'),
+    'ocisictl_run_duration_seconds': ('gauge', 'How long the last run took'),
+    'ocisictl_last_run_timestamp_seconds': ('gauge', 'When the last run ended'),
+    'ocisictl_last_success_timestamp_seconds': ('gauge', 'When the last run without failures ended'),
+}
+
+# the steps (spans) counted by ocisictl_failures
+_FAILURE_STEPS = {'create_image': 'build', 'assemble_distrobox': 'assemble'}
+_RECLAIM_STEPS = {'prune_manager': 'prune', 'clean_manager': 'clean'}
+
+
+@dataclass
+class Sample:
+    name: str
+    value: float
+    labels: dict[str, str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        labels = ','.join(f'{k}="{_escape(v)}"' for k, v in self.labels.items())
+        value = int(self.value) if float(self.value).is_integer() else self.value  # e.g., sizes in full, not 1.2e+09
+        return f'{self.name}{{{labels}}} {value}' if labels else f'{self.name} {value}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metrics(samples: list[Sample]) -> str:
+    lines: list[str] = []
+    for name, (kind, desc) in METRICS.items():
+        if named := [s for s in samples if s.name == name]:
+            lines += [f'# HELP {name} {desc}', f'# TYPE {name} {kind}', *(str(s) for s in named)]
+    return '\n'.join(lines) + '\n'
+
+
+def format_metrics_json(samples: list[Sample]) -> str:
+    return json.dumps([asdict(s) for s in samples], indent=2)
+
+
+def last_success(path: Path, verb: str) -> Optional[float]:
+    """The last successful run of verb recorded in the metrics file path - runs that fail keep reporting it"""
+    try:
+        text = path.read_text()
+        if path.suffix == '.json':
+            return next(
+                (s['value'] for s in json.loads(text)
+                 if s['name'] == 'ocisictl_last_success_timestamp_seconds' and s['labels'].get('verb') == verb),
+                None,
+            )
+
+        pattern = re.compile(rf'^ocisictl_last_success_timestamp_seconds\{{verb="{re.escape(verb)}"\}} (\S+)$', re.MULTILINE)
+        if m := pattern.search(text):
+            return float(m.group(1))
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def run_metrics(
+    verb: str,
+    spans: list[Span],
+    reports: list[SharingReport],
+    images: list[str],
+    distroboxes: dict[str, str],
+    started: float,
+    ended: float,
+    ok: bool,
+    previous_success: Optional[float],
+) -> list[Sample]:
+    """The samples of a run of verb from its spans and the reports of the stores at its end.
+
+    images are the configured images (full_image_name) to report the size of, and distroboxes maps the images assembled
+    to their distrobox names. ok is False if the run failed outright; a step that failed fails the run too.
+    """
+    samples: list[Sample] = []
+    failures = {step: 0 for step in _FAILURE_STEPS.values()}
+    reclaimed: dict[tuple[str, str], int] = {}
+
+    for s in spans:
+        if s.name == 'create_image' and s.image:
+            labels = {'image': s.image, 'manager': s.manager or ''}
+            samples.append(Sample('ocisictl_build_duration_seconds', round(s.duration, 3), labels))
+            samples.append(Sample('ocisictl_build_success', 1 if s.tags.get('ok') else 0, labels))
+        elif s.name == 'assemble_distrobox' and s.image:
+            labels = {'distrobox': distroboxes.get(s.image, s.image), 'manager': s.manager or ''}
+            samples.append(Sample('ocisictl_assemble_duration_seconds', round(s.duration, 3), labels))
+
+        if s.name in _FAILURE_STEPS and s.tags.get('ok') is False:
+            failures[_FAILURE_STEPS[s.name]] += 1
+
+        if s.name in _RECLAIM_STEPS and 'reclaimed' in s.tags:
+            key = (_RECLAIM_STEPS[s.name], s.manager or '')
+            reclaimed[key] = reclaimed.get(key, 0) + s.tags['reclaimed']
+
+    for report in reports:
+        samples.append(Sample('ocisictl_store_bytes', report.unique_bytes, {'manager': report.manager}))
+        for name in images:
+            if img := report.find(name):
+                labels = {'image': name, 'manager': report.manager}
+                samples.append(Sample('ocisictl_image_size_bytes', img.size, labels))
+                samples.append(Sample('ocisictl_image_unique_bytes', report.image_unique_bytes(img.name), labels))
+
+    for (step, manager), size in sorted(reclaimed.items()):
+        samples.append(Sample('ocisictl_reclaimed_bytes', size, {'step': step, 'manager': manager}))
+
+    for step, count in failures.items():
+        samples.append(Sample('ocisictl_failures', count, {'verb': verb, 'step': step}))
+
+    ok = ok and not any(failures.values())
+    samples.append(Sample('ocisictl_run_duration_seconds', round(ended - started, 3), {'verb': verb}))
+    samples.append(Sample('ocisictl_last_run_timestamp_seconds', round(ended), {'verb': verb}))
+    if (success := ended if ok else previous_success) is not None:
+        samples.append(Sample('ocisictl_last_success_timestamp_seconds', round(success), {'verb': verb}))
+
+    return samples
@@ -1,12 +1,34 @@
 import argparse
+import json
 import logging
 import os
 import sys
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
 from pprint import pformat
-from typing import Optional
+from typing import Any, Optional
 
-from yaml import Loader, load_all
+from ocisictl.utils import write_text_atomic
+
+
+def _config_cache_path(file_path: Path) -> Path:
+    cache_home = os.getenv('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_home) / 'ocisictl' / f'{str(file_path).replace("/", "%")}.json'
+
+
+def _load_yaml(file_path: Path) -> list[dict[str, Any]]:
+    # yaml is only imported when the cached parse of the config cannot be used; prefer the C (libyaml) loader
+    from yaml import load_all
+
+    try:
+        from yaml import CSafeLoader as Loader
+    except ImportError:
+        from yaml import SafeLoader as Loader  # type: ignore[assignment]
+
+    with open(file_path) as y:
+        return list(*load_all(y, Loader=Loader))
 
 
 @dataclass
@@ -20,6 +42,21 @@ class ContainerImage:
     manager: Optional[str] = None
     distrobox: Optional[str] = None
     assemble: Optional[bool] = None
+    sync_to: Optional[str] = None  # the other manager whose store the image is copied to by the sync verb
+
+    @property
+    def base_image_name(self) -> Optional[str]:
+        """The image a -dx image is layered on top of (see the IMG and TAG build args)"""
+        return f'{self.name.removesuffix("-dx")}:{self.tag}' if self.is_dx else None
+
+    @property
+    def container_file(self) -> str:
+        cf_suffix = 'img-dx' if self.is_dx else self.name
+        return f'Containerfile.{cf_suffix}'
+
+    @property
+    def container_file_path(self) -> Path:
+        return Path(self.path) / self.container_file
 
     @property
     def distrobox_name(self) -> str:
@@ -31,6 +68,22 @@ class ContainerImage:
         prefix = ''
         return f'{prefix}{self.name}:{self.tag}' if self.tag else f'{prefix}{self.name}'
 
+    @property
+    def is_dx(self) -> bool:
+        return self.name.endswith('-dx')
+
+    def build_args(self) -> dict[str, str]:
+        if not self.is_dx:
+            return {}
+
+        return {
+            'USER': os.getenv('USER', ''),
+            'UID': str(os.getuid()),
+            'GID': str(os.getgid()),
+            'IMG': self.name.removesuffix('-dx'),
+            'TAG': f'{self.tag}',
+        }
+
     def manager_name(self, default: str) -> str:
         return self.manager if self.manager else default
 
@@ -39,6 +92,41 @@ class ContainerImage:
         self.assemble = self.assemble is True or self.name.endswith('-dx')
 
 
+@dataclass
+class ContainerInfo:
+    """A container as reported by a container manager"""
+
+    id: str
+    names: list[str]
+    image: str = ''
+    state: str = ''
+
+    @property
+    def name(self) -> str:
+        return self.names[0] if self.names else self.id
+
+
+@dataclass
+class ImageInfo:
+    """An image as reported by a container manager; layers and labels are only known when inspected"""
+
+    id: str
+    names: list[str]
+    size: int = 0
+    created: str = ''
+    layers: list[str] = field(default_factory=list)
+    labels: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return self.names[0] if self.names else self.id
+
+    @property
+    def short_id(self) -> str:
+        """The id as abbreviated by docker image ls, which is also a prefix of the id reported by podman or inspect"""
+        return self.id.removeprefix('sha256:')[:12]
+
+
 @dataclass
 class AppConfig:
     """The application config"""
@@ -65,12 +153,36 @@ class AppConfig:
     def managers_active(self) -> list[str]:
         return sorted(set(ci.manager for ci in self.images_enabled if ci.manager))
 
+    @property
+    def images_to_sync(self) -> list[ContainerImage]:
+        return [ci for ci in self.images if ci.enabled and ci.sync_to]
+
     @staticmethod
     def from_yaml(file_path: str) -> AppConfig:  # noqa F821
-        with open(file_path) as y:
-            yobjs: list = list(*load_all(y, Loader=Loader))
-            images = [ContainerImage(**ci) for ci in yobjs]
-            return AppConfig(images=images)
+        """Parse file_path - or reuse the previous parse of it, cached while its mtime and size stay the same"""
+        path = Path(file_path).resolve()
+        st = path.stat()
+        key = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+        cache = _config_cache_path(path)
+
+        yobjs: Optional[list[dict[str, Any]]] = None
+        try:
+            cached = json.loads(cache.read_text())
+            if cached.get('key') == key:
+                yobjs = cached['images']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        if yobjs is None:
+            yobjs = _load_yaml(path)
+            try:
+                cache.parent.mkdir(parents=True, exist_ok=True)
+                write_text_atomic(cache, json.dumps({'key': key, 'images': yobjs}))
+            except (OSError, TypeError) as e:
+                logging.debug(f'Could not cache the parsed {path}: {e!r}')
+
+        images = [ContainerImage(**ci) for ci in yobjs]
+        return AppConfig(images=images)
 
 
 @dataclass
@@ -83,10 +195,39 @@ class AppContext:
     def __post_init__(self) -> None:
         self._setup_logging()
 
+    @property
+    def assemble_jobs(self) -> int:
+        return max(getattr(self.args, 'assemble_jobs', 1), 1)
+
+    @property
+    def cache_dir(self) -> Optional[str]:
+        return getattr(self.args, 'cache_dir', None)
+
+    @property
+    def cache_max_bytes(self) -> int:
+        return getattr(self.args, 'cache_max_bytes', 0)
+
+    @property
+    def config_file(self) -> str:
+        return self.args.file
+
     @property
     def dbx_container_manager(self) -> str:
         return os.getenv('DBX_CONTAINER_MANAGER', 'podman')
 
+    @property
+    def log_dir(self) -> Optional[str]:
+        return getattr(self.args, 'log_dir', None)
+
+    @cached_property
+    def run_log_dir(self) -> Optional[Path]:
+        """The directory of this run under --log-dir - log_dir/latest links to it"""
+        return Path(self.log_dir) / time.strftime('%Y%m%d-%H%M%S') if self.log_dir else None
+
+    def log_file(self, name: str) -> Optional[Path]:
+        """The file in the run directory that the output of the commands for name (an image or container) goes to"""
+        return self.run_log_dir / f'{name.replace("/", "_").replace(":", "_")}.log' if self.run_log_dir else None
+
     @property
     def managers(self) -> list[str]:
         mgrs = self.config.managers
@@ -105,6 +246,26 @@ class AppContext:
 
         return mgrs
 
+    @property
+    def debounce(self) -> float:
+        return getattr(self.args, 'debounce', 2.0)
+
+    @property
+    def dry_run(self) -> bool:
+        return getattr(self.args, 'dry_run', False)
+
+    @property
+    def engine_api(self) -> list[str]:
+        return getattr(self.args, 'api', None) or []
+
+    @property
+    def force(self) -> bool:
+        return hasattr(self.args, 'force') and self.args.force
+
+    @property
+    def jobs(self) -> int:
+        return getattr(self.args, 'jobs', 1)
+
     @property
     def list_all(self) -> bool:
         return self.args.all
@@ -117,14 +278,50 @@ class AppContext:
     def list_enabled(self) -> bool:
         return self.args.enabled
 
+    @property
+    def list_history(self) -> bool:
+        return self.args.history
+
     @property
     def list_layers(self) -> bool:
         return self.args.layers
 
+    @property
+    def list_sharing(self) -> bool:
+        return self.args.sharing
+
+    @property
+    def max_bytes(self) -> int:
+        return self.args.max_bytes
+
+    @property
+    def progress(self) -> bool:
+        return getattr(self.args, 'progress', False)
+
+    @property
+    def plan(self) -> bool:
+        return getattr(self.args, 'plan', False)
+
+    @property
+    def metrics_file(self) -> Optional[str]:
+        return getattr(self.args, 'metrics', None)
+
+    @property
+    def poll_interval(self) -> float:
+        return getattr(self.args, 'poll_interval', 1.0)
+
     @property
     def prune(self) -> bool:
         return self.args.prune
 
+    @property
+    def ready_timeout(self) -> float:
+        return getattr(self.args, 'ready_timeout', 60.0)
+
+    @property
+    def resume(self) -> bool:
+        return getattr(self.args, 'resume', False)
+
     @property
     def skip_clean(self) -> bool:
         return hasattr(self.args, 'skip_clean') and self.args.skip_clean
@@ -133,6 +330,18 @@ class AppContext:
     def skip_podman(self) -> bool:
         return hasattr(self.args, 'skip_podman') and self.args.skip_podman
 
+    @property
+    def stop_timeout(self) -> int:
+        return getattr(self.args, 'stop_timeout', 2)
+
+    @property
+    def threshold(self) -> float:
+        return getattr(self.args, 'threshold', 0.8)
+
+    @property
+    def trace_file(self) -> Optional[str]:
+        return getattr(self.args, 'trace', None)
+
     @property
     def verb(self) -> str:
         return self.args.verb
@@ -147,6 +356,16 @@ class AppContext:
             level=log_level, stream=sys.stdout, format='{asctime} - {module} - {levelname} - {funcName} - {message}', style='{'
         )
 
+        if run_log_dir := self.run_log_dir:
+            run_log_dir.mkdir(parents=True, exist_ok=True)
+            latest = run_log_dir.parent / 'latest'
+            latest.unlink(missing_ok=True)
+            latest.symlink_to(run_log_dir.name)
+
+            handler = logging.FileHandler(run_log_dir / 'ocisictl.log')
+            handler.setFormatter(logging.root.handlers[0].formatter)
+            logging.root.addHandler(handler)
+
     def log(self) -> None:
         logging.debug(pformat(self, indent=0, depth=3, width=196, compact=True, sort_dicts=False))
 
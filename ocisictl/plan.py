@@ -0,0 +1,36 @@
+"""The plan of a process run - what it would do, in order, with estimates of how long it takes and the disk it uses"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class PlanAction:
+    """One step of the plan; level is the dependency level of a build - builds of the same level may run in parallel"""
+
+    step: str
+    manager: str
+    targets: list[str] = field(default_factory=list)
+    level: Optional[int] = None
+    seconds: Optional[float] = None
+    disk_delta: Optional[int] = None
+    note: str = ''
+
+
+@dataclass
+class Plan:
+    actions: list[PlanAction]
+    build_seconds: float = 0.0  # the expected wall clock time of the builds given --jobs
+
+    @property
+    def disk_delta(self) -> int:
+        return sum(a.disk_delta for a in self.actions if a.disk_delta is not None)
+
+    @property
+    def seconds(self) -> float:
+        """The expected wall clock time of the run - the builds plus every other step one after the other"""
+        return self.build_seconds + sum(a.seconds for a in self.actions if a.step != 'build' and a.seconds is not None)
+
+    @property
+    def unestimated(self) -> list[PlanAction]:
+        return [a for a in self.actions if a.seconds is None]
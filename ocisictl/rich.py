@@ -1,8 +1,18 @@
+import time
+from typing import Optional
+
 from rich import box, print
 from rich.table import Table
 from rich.text import Text
 
+from ocisictl.gc import Eviction
+from ocisictl.history import ImageTrend
+from ocisictl.lint import HoistCandidate
 from ocisictl.models import ContainerImage
+from ocisictl.plan import Plan
+from ocisictl.sharing import SharingReport
+from ocisictl.trace import Span
+from ocisictl.utils import format_size
 
 
 def print_containerimage_table(imgs: list[ContainerImage], desc: str) -> None:
@@ -34,3 +44,200 @@ def print_containerimage_table(imgs: list[ContainerImage], desc: str) -> None:
         table.add_row(image, img.path, enabled, manager, distrobox, assemble)
 
     print(table)
+
+
+def print_gc_plan(evictions: list[Eviction], total: int, max_bytes: int, dry_run: bool) -> None:
+    reclaimed = sum(e.reclaimed for e in evictions)
+    desc = 'Images to Evict' if dry_run else 'Evicted Images'
+    table = Table(
+        title=f'{desc} - {format_size(total)} on disk, budget {format_size(max_bytes)}', title_justify='left', box=box.ROUNDED
+    )
+
+    table.add_column('Manager')
+    table.add_column('Image', style='blue3')
+    table.add_column('Id')
+    table.add_column('Last Used')
+    table.add_column('Reclaims', justify='right', style='bold dark_green')
+
+    for e in evictions:
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(e.last_used)) if e.last_used else ''
+        table.add_row(e.manager, ', '.join(e.image.names), e.image.short_id, last_used, format_size(e.reclaimed))
+
+    table.add_section()
+    table.add_row('', '', '', '', Text(format_size(reclaimed), style='bold'))
+
+    print(table)
+
+
+def print_history_table(trends: list[ImageTrend]) -> None:
+    table = Table(title='Build History', title_justify='left', box=box.ROUNDED)
+
+    table.add_column('Image', style='blue3')
+    table.add_column('Manager')
+    table.add_column('Runs', justify='right')
+    table.add_column('Up to Date', justify='right', style='dark_green')
+    table.add_column('Last Build', justify='right', style='bold')
+    table.add_column('Avg Build', justify='right')
+    table.add_column('Size', justify='right')
+    table.add_column('Size Change', justify='right')
+    table.add_column('Last Run')
+
+    def seconds(duration: Optional[float]) -> str:
+        return f'{duration:.1f}s' if duration is not None else ''
+
+    for t in sorted(trends, key=lambda t: t.avg_duration or 0.0, reverse=True):
+        last_build: str | Text = seconds(t.last_duration)
+        if t.last_duration is not None and t.avg_duration and t.builds > 1:
+            # flag builds that got noticeably slower or faster than usual
+            if t.last_duration > t.avg_duration * 1.2:
+                last_build = Text(f'{last_build} ▲', style='bold red')
+            elif t.last_duration < t.avg_duration * 0.8:
+                last_build = Text(f'{last_build} ▼', style='bold dark_green')
+
+        table.add_row(
+            t.image,
+            t.manager,
+            str(t.runs),
+            f'{t.cache_hit_rate:.0%}',
+            last_build,
+            seconds(t.avg_duration),
+            format_size(t.last_size) if t.last_size is not None else '',
+            signed_size(t.size_change) if t.size_change else '',
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(t.last_run)),
+        )
+
+    print(table)
+
+
+def print_hoist_candidates(candidates: list[HoistCandidate], estimates: dict[str, float]) -> None:
+    table = Table(title='RUN Commands to Hoist into the Parent Image', title_justify='left', box=box.ROUNDED, show_lines=True)
+
+    table.add_column('Parent', style='blue3')
+    table.add_column('Command')
+    table.add_column('Run By')
+    table.add_column('Similarity', justify='right')
+    table.add_column('Disk Saved (up to)', justify='right', style='bold dark_green')
+    table.add_column('Build Time Saved (up to)', justify='right', style='dark_green')
+
+    for c in candidates:
+        seconds = c.seconds_saved(estimates)
+        table.add_row(
+            c.parent,
+            c.command,
+            '\n'.join(c.images),
+            f'{c.similarity:.0%}',
+            format_size(c.bytes_saved) if c.bytes_saved is not None else '',
+            f'{seconds:.1f}s' if seconds is not None else '',
+        )
+
+    print(table)
+
+    if not candidates:
+        print('No RUN commands are repeated by images built FROM the same parent')
+
+
+def print_plan(plan: Plan, jobs: int) -> None:
+    table = Table(title='Plan', title_justify='left', box=box.ROUNDED)
+
+    table.add_column('#', justify='right')
+    table.add_column('Step', style='bold')
+    table.add_column('Level', justify='center')
+    table.add_column('Manager')
+    table.add_column('Targets', style='blue3')
+    table.add_column('Est. Time', justify='right')
+    table.add_column('Disk', justify='right')
+    table.add_column('Note')
+
+    for i, a in enumerate(plan.actions, start=1):
+        table.add_row(
+            str(i),
+            a.step,
+            str(a.level) if a.level is not None else '',
+            a.manager,
+            '\n'.join(a.targets),
+            f'{a.seconds:.0f}s' if a.seconds is not None else '?',
+            signed_size(a.disk_delta) if a.disk_delta is not None else '?',
+            a.note,
+        )
+
+    print(table)
+
+    summary = f'About {plan.seconds / 60:.1f} minutes (builds {plan.build_seconds / 60:.1f} with --jobs {jobs}); disk {signed_size(plan.disk_delta)}'
+    print(Text(summary, style='bold'))
+    if unestimated := plan.unestimated:
+        print(Text(f'{len(unestimated)} step(s) have no estimate (?) - e.g., assembles and images that were never built', style='orange4'))
+
+
+def print_sharing_report(report: SharingReport, not_sharing: list[tuple[str, str]]) -> None:
+    summary = Table(title=f'{report.manager} - Layer Sharing', title_justify='left', box=box.ROUNDED)
+
+    summary.add_column('Images', justify='right')
+    summary.add_column('Layers', justify='right')
+    summary.add_column('Naive Size', justify='right')
+    summary.add_column('On Disk', justify='right', style='bold')
+    summary.add_column('Saved', justify='right', style='bold dark_green')
+
+    summary.add_row(
+        str(len(report.images)),
+        str(len(report.layers)),
+        format_size(report.naive_bytes),
+        format_size(report.unique_bytes),
+        format_size(report.saved_bytes),
+    )
+    print(summary)
+
+    bases = Table(title=f'{report.manager} - Bytes Saved per Base Image', title_justify='left', box=box.ROUNDED)
+
+    bases.add_column('Base Image', style='blue3')
+    bases.add_column('Layers Introduced', justify='right')
+    bases.add_column('Reused By', justify='right')
+    bases.add_column('Saved', justify='right', style='bold dark_green')
+
+    for name, saved in report.shared_by_base().items():
+        introduced = [lu for lu in report.layers.values() if lu.introduced_by == name]
+        reused_by = max(len(lu.images) - 1 for lu in introduced)
+        bases.add_row(name, str(len(introduced)), str(reused_by), format_size(saved))
+    print(bases)
+
+    for child, parent in not_sharing:
+        print(Text(f'{child} shares no layers with its parent {parent}', style='bold red'))
+
+    if unsized := report.unsized_layers:
+        print(Text(f'{len(unsized)} layer(s) of unknown size are counted as 0 bytes', style='orange4'))
+
+
+def signed_size(size: int) -> str:
+    return f'+{format_size(size)}' if size > 0 else format_size(size)
+
+
+def print_trace_summary(spans: list[Span], top: int = 15) -> None:
+    if not spans:
+        return
+
+    wall = max(s.end for s in spans) - min(s.start for s in spans)
+    table = Table(
+        title=f'Slowest Phases (of {len(spans)} in {wall:.1f}s)', title_justify='left', box=box.ROUNDED
+    )
+
+    table.add_column('Phase', style='blue3', no_wrap=True)
+    table.add_column('Kind')
+    table.add_column('Manager')
+    table.add_column('Image')
+    table.add_column('Duration', justify='right', style='bold')
+    table.add_column('% of Run', justify='right')
+    table.add_column('Exit', justify='right')
+
+    for s in sorted(spans, key=lambda s: s.duration, reverse=True)[:top]:
+        failed = s.exit_code not in (None, 0) or s.tags.get('ok') is False or 'error' in s.tags
+        exit_code = '' if s.exit_code is None else str(s.exit_code)
+        table.add_row(
+            s.name,
+            s.cat,
+            s.manager or '',
+            s.image or '',
+            f'{s.duration:.2f}s',
+            f'{s.duration / wall:.0%}' if wall else '',
+            Text(exit_code or 'failed', style='bold red') if failed else exit_code,
+        )
+
+    print(table)
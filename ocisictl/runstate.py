@@ -0,0 +1,92 @@
+"""The state of a process run - the steps it completed and the image digests they produced - so a failed run can be resumed"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from ocisictl.utils import write_text_atomic
+
+
+def default_run_state_path(config_file: str) -> Path:
+    """The run state of the last process run of config_file"""
+    state_home = os.getenv('XDG_STATE_HOME') or Path.home() / '.local' / 'state'
+    return Path(state_home) / 'ocisictl' / 'runs' / f'{str(Path(config_file).resolve()).replace("/", "%")}.json'
+
+
+@dataclass
+class StepState:
+    """The outcome of a step - digest is the id of the image it built or assembled a distrobox from"""
+
+    ok: bool
+    finished: float
+    digest: Optional[str] = None
+
+
+@dataclass
+class RunState:
+    """The steps of a run (e.g., prune, build fedora-go:latest, assemble fedora-go-dx, clean) - saved as each one ends;
+    safe to record into from the build threads. Nothing is saved if path is None."""
+
+    path: Optional[Path]
+    started: float = field(default_factory=time.time)
+    complete: bool = False
+    steps: dict[str, StepState] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    @property
+    def failures(self) -> list[str]:
+        return [step for step, s in self.steps.items() if not s.ok]
+
+    def digest(self, step: str) -> Optional[str]:
+        """The digest step produced - None unless it succeeded"""
+        s = self.steps.get(step)
+        return s.digest if s and s.ok else None
+
+    def done(self, step: str) -> bool:
+        return step in self.steps and self.steps[step].ok
+
+    def failed(self, step: str) -> bool:
+        return step in self.steps and not self.steps[step].ok
+
+    def finish(self) -> None:
+        with self._lock:
+            self.complete = True
+            self._save()
+
+    def record(self, step: str, ok: bool, digest: Optional[str] = None) -> None:
+        with self._lock:
+            self.steps[step] = StepState(ok=ok, finished=time.time(), digest=digest)
+            self._save()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+
+        state = {'started': self.started, 'complete': self.complete, 'steps': {k: asdict(s) for k, s in self.steps.items()}}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_text_atomic(self.path, json.dumps(state, indent=2))
+        except OSError as e:
+            logging.warning(f'Could not save the run state to {self.path}: {e!r}')
+
+    @staticmethod
+    def load(path: Path) -> Optional[RunState]:  # noqa F821
+        """The run state saved in path; None if there is none (or it cannot be read)"""
+        try:
+            state = json.loads(path.read_text())
+            steps = {k: StepState(**s) for k, s in state['steps'].items()}
+            return RunState(path=path, started=state['started'], complete=state['complete'], steps=steps)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f'Could not read the run state in {path}: {e!r}')
+            return None
@@ -0,0 +1,106 @@
+"""Layer sharing analytics - how much disk the shared image hierarchy actually saves"""
+
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from ocisictl.containerfile import normalize_image_ref
+from ocisictl.graph import ImageGraph
+from ocisictl.models import ImageInfo
+
+
+@dataclass
+class LayerUse:
+    """A layer in the store of a manager and the images that reference it"""
+
+    digest: str
+    size: int
+    sized: bool = True
+    images: list[str] = field(default_factory=list)
+
+    @property
+    def introduced_by(self) -> str:
+        """The image that added the layer to the hierarchy - the first (fewest layers) image to reference it"""
+        return self.images[0]
+
+
+@dataclass
+class SharingReport:
+    """The index from layer digest to the images of a manager that use it"""
+
+    manager: str
+    images: list[ImageInfo]
+    layers: dict[str, LayerUse]
+
+    @property
+    def naive_bytes(self) -> int:
+        """What the images would take on disk if no layers were shared"""
+        return sum(lu.size * len(lu.images) for lu in self.layers.values())
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.naive_bytes - self.unique_bytes
+
+    @property
+    def unique_bytes(self) -> int:
+        """What the images actually take on disk - each layer counted once"""
+        return sum(lu.size for lu in self.layers.values())
+
+    @property
+    def unsized_layers(self) -> list[str]:
+        return [lu.digest for lu in self.layers.values() if not lu.sized]
+
+    def freed_bytes(self, names: Iterable[str]) -> int:
+        """Bytes that removing all of the images would reclaim - the layers no other image references"""
+        names = set(names)
+        return sum(lu.size for lu in self.layers.values() if set(lu.images) <= names)
+
+    def find(self, ref: str) -> Optional[ImageInfo]:
+        """The image known by ref (e.g., a full_image_name) under any of its names"""
+        ref = normalize_image_ref(ref)
+        return next((img for img in self.images if ref in {normalize_image_ref(name) for name in img.names}), None)
+
+    def image(self, name: str) -> Optional[ImageInfo]:
+        return next((img for img in self.images if img.name == name), None)
+
+    def image_introduced_bytes(self, name: str) -> int:
+        """Bytes of the layers the image added to the hierarchy - i.e., what building it (again) adds to the store"""
+        return sum(lu.size for lu in self.layers.values() if lu.introduced_by == name)
+
+    def image_unique_bytes(self, name: str) -> int:
+        """Bytes that only the image references - i.e., what removing it would reclaim"""
+        img = self.image(name)
+        return sum(self.layers[lyr].size for lyr in img.layers if len(self.layers[lyr].images) == 1) if img else 0
+
+    def shared_by_base(self) -> dict[str, int]:
+        """Bytes saved per base image - the layers an image introduced times the number of other images reusing them"""
+        saved: dict[str, int] = {}
+
+        for lu in self.layers.values():
+            if len(lu.images) > 1:
+                saved[lu.introduced_by] = saved.get(lu.introduced_by, 0) + lu.size * (len(lu.images) - 1)
+
+        return dict(sorted(saved.items(), key=lambda kv: kv[1], reverse=True))
+
+    def not_sharing(self, graph: ImageGraph) -> list[tuple[str, str]]:
+        """(image, intended parent) pairs present in the store that have no layers in common"""
+        by_ref = {normalize_image_ref(name): img for img in self.images for name in img.names}
+        pairs: list[tuple[str, str]] = []
+
+        for child, parents in graph.parents.items():
+            for parent in parents:
+                if (c := by_ref.get(child)) and (p := by_ref.get(parent)) and not set(c.layers) & set(p.layers):
+                    pairs.append((child, parent))
+
+        return pairs
+
+    @staticmethod
+    def from_images(manager: str, images: list[ImageInfo], layer_sizes: dict[str, int]) -> SharingReport:  # noqa F821
+        """Build the report; layers missing from layer_sizes count as 0 bytes and are reported as unsized"""
+        layers: dict[str, LayerUse] = {}
+
+        for img in sorted(images, key=lambda img: (len(img.layers), img.name)):
+            for lyr in dict.fromkeys(img.layers):
+                lu = layers.setdefault(lyr, LayerUse(digest=lyr, size=layer_sizes.get(lyr, 0), sized=lyr in layer_sizes))
+                lu.images.append(img.name)
+
+        return SharingReport(manager=manager, images=images, layers=layers)
@@ -1,128 +1,313 @@
 import logging
-import os
+import threading
 import time
 from contextlib import contextmanager
 from pathlib import Path
 from pprint import pformat
-from typing import Generator
+from typing import TYPE_CHECKING, Callable, Generator, Optional
 
 from ocisictl.adapters import (
-    container_remove,
-    container_stop,
+    container_exists,
+    containers_all,
+    containers_remove,
     containers_running,
+    containers_stop,
     distrobox_assemble,
     distrobox_assemble_fixup_bins,
     image_build,
-    image_names,
-    image_remove,
-    list_image_layers,
+    image_copy,
+    image_id,
+    image_inspect,
+    image_label,
+    image_layer_sizes,
+    image_list,
+    images_inspect,
+    images_remove,
     prune_buildx,
-    prune_system
+    prune_system,
+    use_engine_api
 )
-from ocisictl.models import AppContext, ContainerImage
-from ocisictl.rich import print_containerimage_table
-from ocisictl.utils import log_entry_exit
+from ocisictl import trace
+from ocisictl.containerfile import normalize_image_ref
+from ocisictl.fingerprint import FINGERPRINT_LABEL, fingerprint
+from ocisictl.graph import ImageGraph, run_graph
+from ocisictl.models import AppConfig, AppContext, ContainerImage
+from ocisictl.sharing import SharingReport
+from ocisictl.utils import for_each_concurrently, format_size, log_entry_exit, wait_until, write_text_atomic
 
+if TYPE_CHECKING:
+    from ocisictl.history import BuildHistory, BuildRecord
+    from ocisictl.lint import HoistCandidate
+    from ocisictl.plan import Plan
+    from ocisictl.runstate import RunState
 
-def assemble_distrobox(ctx: AppContext, image: ContainerImage) -> None:
+# ocisictl.rich is imported by the steps that print tables - importing rich noticeably slows down startup. Likewise the
+# modules only some verbs use (history, watch, lint, metrics, ...) are imported by those steps, so list stays fast
+
+
+@log_entry_exit
+def assemble_distrobox(ctx: AppContext, image: ContainerImage) -> bool:
     manager = image.manager_name(default=ctx.dbx_container_manager)
+    trace.tag(manager=manager)
 
     logging.info(f'Assembling {image.distrobox_name} using {manager} ...')
 
-    distrobox_assemble(manager=manager, name=image.distrobox_name, verbose=ctx.verbose)
-    distrobox_assemble_fixup_bins(manager=manager, name=image.distrobox_name, verbose=ctx.verbose)
+    try:
+        rc = distrobox_assemble(
+            manager=manager,
+            name=image.distrobox_name,
+            verbose=ctx.verbose,
+            log_file=ctx.log_file(image.distrobox_name),
+            progress=ctx.progress,
+        )
+        if rc != 0:
+            logging.error(f'Assembling {image.distrobox_name} using {manager} ... failed: {rc=}')
+            return False
+
+        distrobox_assemble_fixup_bins(manager=manager, name=image.distrobox_name)
+    except Exception:
+        logging.exception(f'Assembling {image.distrobox_name} using {manager} ... failed')
+        return False
 
     logging.info(f'Assembling {image.distrobox_name} using {manager} ... done.')
+    return True
 
 
-@contextmanager
-def changed_dir(path: str) -> Generator[None]:
-    origin = Path().absolute()
-    logging.info(f'{origin=} ==> {path=}')
+def images_to_clean(ctx: AppContext, keep_parents: bool = False) -> list[ContainerImage]:
+    """The images clean removes - in reverse config order. With keep_parents the images that the assembled images are
+    built on are kept: their layers are all used by the assembled images, so removing them reclaims nothing, and the
+    next process run needs them to skip the builds whose fingerprint is unchanged."""
+    images = list(reversed(ctx.config.images_not_assemble))
+    if not keep_parents:
+        return images
 
-    try:
-        os.chdir(path)
+    graph = ImageGraph.from_images(ctx.config.images_enabled)
+    parents = graph.ancestors(img.full_image_name for img in ctx.config.containers_to_assemble)
+    if kept := [img.full_image_name for img in images if img.full_image_name in parents]:
+        logging.info(f'Keeping {kept} - the assembled images are built on them')
 
-        yield
-    finally:
-        os.chdir(origin)
+    return [img for img in images if img.full_image_name not in parents]
 
 
 @log_entry_exit
-def clean_images(ctx: AppContext) -> None:
-    for image in reversed(ctx.config.images_not_assemble):
-        manager = image.manager_name(default=ctx.dbx_container_manager)
+def clean_images(ctx: AppContext, keep_parents: bool = False) -> None:
+    # managers use separate stores, so each manager is cleaned concurrently
+    by_manager: dict[str, list[ContainerImage]] = {}
+    for image in images_to_clean(ctx=ctx, keep_parents=keep_parents):
+        by_manager.setdefault(image.manager_name(default=ctx.dbx_container_manager), []).append(image)
 
-        logging.info(f'Cleaning {image.full_image_name} with {manager} ...')
+    for manager in ctx.managers_active:
+        by_manager.setdefault(manager, [])
 
-        image_remove(manager=manager, image_name=image.full_image_name, verbose=ctx.verbose)
+    for_each_concurrently(by_manager, lambda manager: clean_manager(ctx=ctx, manager=manager, images=by_manager[manager]))
 
-        logging.info(f'Cleaning {image.full_image_name} with {manager} ... done.')
+    evict_build_cache(ctx=ctx)
 
-    for manager in ctx.managers_active:
-        if ctx.skip_podman and manager == 'podman':
-            logging.info(f'Skipping pruning buildx with {manager}')
-            continue
 
+@log_entry_exit
+def clean_manager(ctx: AppContext, manager: str, images: list[ContainerImage]) -> None:
+    before = store_bytes(ctx=ctx, manager=manager) if ctx.metrics_file else None
+
+    if images:
+        names = [image.full_image_name for image in images]
+        logging.info(f'Cleaning {names} with {manager} ...')
+
+        removed = images_remove(manager=manager, image_names=names, verbose=ctx.verbose)
+        log_batch_results(f'Cleaning with {manager}', removed)
+
+        logging.info(f'Cleaning {names} with {manager} ... done.')
+
+    if manager in ctx.managers_active and ctx.skip_podman and manager == 'podman':
+        logging.info(f'Skipping pruning buildx with {manager}')
+    elif manager in ctx.managers_active:
         logging.info(f'Pruning buildx with {manager}')
         prune_buildx(manager=manager, verbose=ctx.verbose)
 
+    if before is not None:
+        trace.tag(reclaimed=before - store_bytes(ctx=ctx, manager=manager))
 
-def create_image(ctx: AppContext, image: ContainerImage) -> None:
-    manager = image.manager_name(default=ctx.dbx_container_manager)
-
-    logging.info(f'Creating {image.full_image_name} using {manager} ...')
 
-    if not ctx.prune:
-        container_stop(manager=manager, name=image.distrobox_name, verbose=ctx.verbose)
-        container_remove(manager=manager, name=image.distrobox_name, verbose=ctx.verbose)
-        image_remove(manager=manager, image_name=image.full_image_name, verbose=ctx.verbose)
+@log_entry_exit
+def create_image(ctx: AppContext, image: ContainerImage) -> bool:
+    from ocisictl.buildcache import cache_options, commit_cache, discard_cache
 
-    build_args = ''
-    cf_suffix = image.name
-    if image.name.endswith('-dx'):
-        build_args = '--build-arg USER=$USER'
-        build_args += ' --build-arg UID=`id -u $USER`'
-        build_args += ' --build-arg GID=`id -g $USER`'
+    manager = image.manager_name(default=ctx.dbx_container_manager)
+    trace.tag(manager=manager)
 
-        build_args += f' --build-arg IMG={image.name.removesuffix("-dx")}'
-        build_args += f' --build-arg TAG={image.tag}'
+    logging.info(f'Creating {image.full_image_name} using {manager} ...')
 
-        cf_suffix = 'img-dx'
+    cache_dir = ctx.cache_dir
+    cache_from, cache_to = None, None
+    if cache_dir:
+        cache_from, cache_to = cache_options(manager=manager, cache_dir=cache_dir, image_name=image.full_image_name)
 
-    with changed_dir(image.path):
-        image_build(
+    rc = None
+    try:
+        rc = image_build(
             manager=manager,
-            container_file=f'Containerfile.{cf_suffix}',
+            container_file=image.container_file,
             image_name=image.full_image_name,
-            build_args=build_args,
+            build_args=image.build_args(),
+            labels={FINGERPRINT_LABEL: image_fingerprint(ctx=ctx, image=image)},
+            context_dir=image.path,
             verbose=ctx.verbose,
+            cache_from=cache_from,
+            cache_to=cache_to,
+            log_file=ctx.log_file(image.full_image_name),
+            progress=ctx.progress,
         )
+    finally:
+        # a failed or interrupted build leaves a partial export behind
+        if cache_dir and cache_to:
+            if rc == 0:
+                commit_cache(cache_dir=cache_dir, image_name=image.full_image_name)
+            else:
+                discard_cache(cache_dir=cache_dir, image_name=image.full_image_name)
+
+    if rc != 0:
+        logging.error(f'Creating {image.full_image_name} using {manager} ... failed: {rc=}')
+        return False
 
     logging.info(f'Creating {image.full_image_name} using {manager} ... done.')
+    return True
 
 
 @log_entry_exit
 def do_prune(ctx: AppContext) -> None:
-    for manager in ctx.managers_active:
-        if ctx.skip_podman and manager == 'podman':
-            logging.info(f'Skipping shutting down and pruning using {manager} ...')
-            continue
+    for_each_concurrently(ctx.managers_active, lambda manager: prune_manager(ctx=ctx, manager=manager))
 
-        logging.info(f'Shutting down and pruning using {manager} ...')
+    evict_build_cache(ctx=ctx)
 
-        for c in containers_running(manager=manager, verbose=ctx.verbose):
-            container_stop(manager=manager, name=c, verbose=ctx.verbose)
 
-        prune_buildx(manager=manager, verbose=ctx.verbose)
-        prune_system(manager=manager, verbose=ctx.verbose)
+def evict_build_cache(ctx: AppContext) -> None:
+    """Pruning leaves the --cache-dir alone - other than keeping it within --cache-max-bytes"""
+    from ocisictl.buildcache import evict_cache
+
+    if not ctx.cache_dir:
+        return
+
+    if evicted := evict_cache(cache_dir=ctx.cache_dir, max_bytes=ctx.cache_max_bytes):
+        logging.info(f'Evicted least recently used build cache entries from {ctx.cache_dir}: {evicted}')
+
+
+@log_entry_exit
+def gc(ctx: AppContext) -> None:
+    """Evict the least recently used images until the images of all managers fit in --max-bytes"""
+    from ocisictl.gc import plan_gc
+    from ocisictl.history import open_history
+    from ocisictl.rich import print_gc_plan
+
+    reports = [report for manager in ctx.config.managers if (report := sharing_report(ctx=ctx, manager=manager))]
+
+    # configured -dx images and images of containers are kept - along with every layer they use. Stopped containers
+    # count too: rmi -f (podman) would remove them with their image, e.g., a distrobox that is not entered right now
+    dx_images = {normalize_image_ref(img.full_image_name) for img in ctx.config.images if img.is_dx}
+    protected = {
+        report.manager: dx_images | {c.image for c in containers_all(manager=report.manager, verbose=ctx.verbose)}
+        for report in reports
+    }
+    protected = {manager: refs | {normalize_image_ref(ref) for ref in refs} for manager, refs in protected.items()}
+
+    last_used: dict[str, float] = {}
+    if history := open_history():
+        last_used = {t.image: t.last_run for t in history.trends()}
+        history.close()
+
+    total = sum(report.unique_bytes for report in reports)
+    evictions = plan_gc(reports=reports, protected=protected, last_used=last_used, max_bytes=ctx.max_bytes)
+    remaining = total - sum(e.reclaimed for e in evictions)
+
+    print_gc_plan(evictions, total=total, max_bytes=ctx.max_bytes, dry_run=ctx.dry_run)
+
+    if remaining > ctx.max_bytes:
+        logging.warning(
+            f'Images still take {format_size(remaining)} - only unprotected images can be evicted to fit {format_size(ctx.max_bytes)}'
+        )
+
+    if ctx.dry_run:
+        return
+
+    by_manager: dict[str, list[str]] = {}
+    for e in evictions:
+        by_manager.setdefault(e.manager, []).extend(e.image.names)
+
+    for_each_concurrently(
+        by_manager,
+        lambda manager: log_batch_results(
+            f'Evicting images with {manager}',
+            images_remove(manager=manager, image_names=by_manager[manager], verbose=ctx.verbose),
+        ),
+    )
+
 
-        logging.info(f'Shutting down and pruning using {manager} ... done.')
+def image_fingerprint(ctx: AppContext, image: ContainerImage) -> str:
+    manager = image.manager_name(default=ctx.dbx_container_manager)
+    configured = {normalize_image_ref(img.full_image_name) for img in ctx.config.images}
+
+    def parent_digest(ref: str) -> Optional[str]:
+        return image_id(manager=manager, image_name=ref, verbose=ctx.verbose) if normalize_image_ref(ref) in configured else None
+
+    return fingerprint(image, parent_digest=parent_digest)
+
+
+def log_batch_results(desc: str, results: dict[str, bool], level: int = logging.WARNING) -> None:
+    if failed := [name for name, ok in results.items() if not ok]:
+        logging.log(level, f'{desc} ... failed for {failed}')
+    logging.debug(f'{desc}: {results}')
+
+
+@log_entry_exit
+def lint_sharing(ctx: AppContext) -> list[HoistCandidate]:
+    """The RUN commands that images built FROM the same parent repeat, with the sizes of their layers where known"""
+    from ocisictl.lint import RunCommand, hoist_candidates, run_commands
+
+    # Containerfile.img-dx only maps the user of each -dx image; there is nothing to hoist from it
+    images = [img for img in ctx.config.images if not img.is_dx and img.container_file_path.exists()]
+
+    siblings: dict[str, dict[str, list[RunCommand]]] = {}
+    layer_counts: dict[str, int] = {}
+    for img in images:
+        parent, commands, layer_counts[img.full_image_name] = run_commands(
+            image=img.full_image_name, container_file=img.container_file_path, build_args=img.build_args()
+        )
+        if parent:
+            siblings.setdefault(normalize_image_ref(parent), {})[img.full_image_name] = commands
+
+    # the layers each RUN instruction added - the layers of the image that its parent does not have
+    reports = {manager: report for manager in ctx.config.managers if (report := sharing_report(ctx=ctx, manager=manager))}
+    by_name = {img.full_image_name: img for img in images}
+    for parent, by_image in siblings.items():
+        for name, commands in by_image.items():
+            report = reports.get(by_name[name].manager_name(default=ctx.dbx_container_manager))
+            info = report.find(name) if report else None
+            parent_info = report.find(parent) if report else None
+            if not report or not info or not parent_info:
+                continue
+
+            parent_layers = set(parent_info.layers)
+            own = [lyr for lyr in info.layers if lyr not in parent_layers]
+            if len(own) != layer_counts[name]:
+                logging.debug(f'{name}: cannot match {len(own)} layers to its instructions')
+                continue
+
+            for rc in commands:
+                rc.size = report.layers[own[rc.layer]].size
+
+    candidates = [
+        candidate
+        for parent, by_image in siblings.items()
+        if len(by_image) > 1
+        for candidate in hoist_candidates(by_image, parent=parent, threshold=ctx.threshold)
+    ]
+
+    return sorted(candidates, key=lambda c: (c.bytes_saved or 0, len(c.commands)), reverse=True)
 
 
 @log_entry_exit
 def list_all(ctx: AppContext) -> None:
     """Given the config file in force, list all containers"""
+    from ocisictl.rich import print_containerimage_table
+
     # print(pformat(ctx.config.images, width=196, compact=True, sort_dicts=False))
     print_containerimage_table(ctx.config.images, desc='All Configured Images')
 
@@ -130,6 +315,8 @@ def list_all(ctx: AppContext) -> None:
 @log_entry_exit
 def list_assemble(ctx: AppContext) -> None:
     """Given the config file in force, list the containers to assemble"""
+    from ocisictl.rich import print_containerimage_table
+
     # print(pformat(ctx.config.containers_to_assemble, width=196, compact=True, sort_dicts=False))
     print_containerimage_table(ctx.config.containers_to_assemble, desc='Images to Assemble')
 
@@ -137,57 +324,630 @@ def list_assemble(ctx: AppContext) -> None:
 @log_entry_exit
 def list_enabled(ctx: AppContext) -> None:
     """Given the config file in force, list the images to create"""
+    from ocisictl.rich import print_containerimage_table
+
     # print(pformat(ctx.config.images_enabled, width=196, compact=True, sort_dicts=False))
     print_containerimage_table(ctx.config.images_enabled, desc='Enabled Images')
 
 
+@log_entry_exit
+def list_history(ctx: AppContext) -> None:
+    from ocisictl.history import open_history
+    from ocisictl.rich import print_history_table
+
+    if history := open_history():
+        print_history_table(history.trends())
+        history.close()
+
+
 @log_entry_exit
 def list_layers(ctx: AppContext) -> None:
     for manager in ctx.config.managers:
-        imgs_names = image_names(manager=manager, verbose=ctx.verbose)
-        if len(imgs_names) == 0:
+        imgs = image_list(manager=manager, verbose=ctx.verbose)
+        if len(imgs) == 0:
             continue
 
-        logging.debug(pformat(imgs_names))
+        logging.debug(pformat([img.name for img in imgs]))
+
+        # inspect by id - once per image even if it has several names
+        ids = list(dict.fromkeys(img.id for img in imgs))
+        infos = {info.short_id: info for info in images_inspect(manager=manager, image_names=ids, verbose=ctx.verbose)}
+
+        for img in imgs:
+            logging.debug(f'{manager} - {img.name}')
+            if info := infos.get(img.short_id):
+                print(f'\n{manager} - {img.name}')
+                for layer in info.layers:
+                    print(f'- {layer}')
 
-        for img_name in imgs_names:
-            logging.debug(f'{manager} - {img_name}')
-            list_image_layers(manager=manager, image_name=img_name, verbose=ctx.verbose)
+
+@log_entry_exit
+def list_sharing(ctx: AppContext) -> None:
+    from ocisictl.rich import print_sharing_report
+
+    graph = ImageGraph.from_images(ctx.config.images)
+
+    for manager in ctx.config.managers:
+        if report := sharing_report(ctx=ctx, manager=manager):
+            print_sharing_report(report, not_sharing=report.not_sharing(graph))
 
 
 @log_entry_exit
-def process(ctx: AppContext) -> None:
+def plan_process(ctx: AppContext) -> Plan:
+    """What process would do, with estimates from the build history and the stores - which are inspected, not changed"""
+    from ocisictl.history import open_history
+    from ocisictl.plan import Plan, PlanAction
+
+    graph = ImageGraph.from_images(ctx.config.images_enabled)
+    stale = stale_images(ctx=ctx, graph=graph)
+    reports = {manager: sharing_report(ctx=ctx, manager=manager) for manager in ctx.managers}
+
+    def slot(img: ContainerImage) -> str:
+        return img.manager_name(default=ctx.dbx_container_manager)
+
+    def present(images: list[ContainerImage]) -> list[str]:
+        """The names, as in the sharing report of their manager, of the images that exist"""
+        return [info.name for img in images if (report := reports.get(slot(img))) and (info := report.find(img.full_image_name))]
+
+    def by_manager(images: list[ContainerImage]) -> dict[str, list[ContainerImage]]:
+        grouped: dict[str, list[ContainerImage]] = {}
+        for img in images:
+            grouped.setdefault(slot(img), []).append(img)
+        return grouped
+
+    estimates: dict[str, float] = {}
+    last_sizes: dict[str, int] = {}
+    if history := open_history():
+        estimates = history.estimates()
+        last_sizes = {t.image: t.last_size for t in history.trends() if t.last_size is not None}
+        history.close()
+    default_estimate = sum(estimates.values()) / len(estimates) if estimates else None
+
+    def estimate(name: str) -> float:
+        return estimates.get(name, default_estimate or 0.0) if name in stale else 0.0
+
+    actions: list[PlanAction] = []
+    stale_imgs = [img for img in graph.images if img.full_image_name in stale]
+
     if ctx.prune:
+        for manager in ctx.managers_active:
+            if ctx.skip_podman and manager == 'podman':
+                actions.append(PlanAction('prune', manager, note='skipped - --skip_podman'))
+                continue
+
+            if running := [c.name for c in containers_running(manager=manager, verbose=ctx.verbose)]:
+                actions.append(PlanAction('stop containers', manager, running, seconds=ctx.stop_timeout))
+
+            report = reports.get(manager)
+            actions.append(
+                PlanAction(
+                    'prune', manager, ['buildx', 'system'], disk_delta=-report.unique_bytes if report else 0,
+                    note='removes all images, stopped containers, volumes and the build cache'
+                )
+            )
+    else:
+        for manager, imgs in by_manager(list(reversed(stale_imgs))).items():
+            if containers := [
+                img.distrobox_name for img in imgs if container_exists(manager=manager, name=img.distrobox_name, verbose=ctx.verbose)
+            ]:
+                actions.append(PlanAction('stop / remove containers', manager, containers, seconds=ctx.stop_timeout))
+
+            if names := present(imgs):
+                report = reports[manager]
+                actions.append(PlanAction('remove images', manager, names, disk_delta=-report.freed_bytes(names) if report else None))
+
+    for level, imgs in enumerate(graph.levels()):
+        for img in imgs:
+            name = img.full_image_name
+            if name not in stale:
+                continue
+
+            report = reports.get(slot(img))
+            info = report.find(name) if report else None
+            disk = report.image_introduced_bytes(info.name) if report and info else last_sizes.get(name)
+            seconds = estimates.get(name, default_estimate)
+            actions.append(
+                PlanAction('build', slot(img), [name], level=level, seconds=seconds, disk_delta=disk, note='forced' if ctx.force else '')
+            )
+
+    for img in ctx.config.containers_to_assemble:
+        manager = slot(img)
+        if img.full_image_name not in stale and container_exists(manager=manager, name=img.distrobox_name, verbose=ctx.verbose):
+            continue
+        actions.append(PlanAction('assemble', manager, [img.distrobox_name], note=f'from {img.full_image_name}'))
+
+    if not ctx.skip_clean:
+        for manager, imgs in by_manager(images_to_clean(ctx=ctx, keep_parents=True)).items():
+            names = present(imgs)
+            report = reports.get(manager)
+            actions.append(
+                PlanAction('clean', manager, [img.full_image_name for img in imgs], disk_delta=-report.freed_bytes(names) if report else None)
+            )
+
+    paths = graph.critical_paths(estimate)
+    build_seconds = remaining_time(stale_imgs, paths, estimate, jobs=ctx.jobs, slot=slot) if estimates else 0.0
+
+    return Plan(actions=actions, build_seconds=build_seconds)
+
+
+@log_entry_exit
+def process(ctx: AppContext, only: Optional[set[str]] = None) -> None:
+    """Build and assemble the enabled images - or only those named in only (by full_image_name).
+
+    Each step of a run of all the enabled images is recorded in a run state file, which process --resume continues from.
+    """
+    from ocisictl.history import BuildRecord, open_history
+
+    state = run_state(ctx=ctx, only=only)
+
+    if ctx.prune and state.done('prune'):
+        logging.info('Skipping prune step - done by the interrupted run')
+    elif ctx.prune:
         do_prune(ctx=ctx)
+        state.record('prune', ok=True)
     else:
         logging.warning(f'Skipping prune step - prune={ctx.prune}')
 
-    for img in ctx.config.images_enabled:
-        create_image(ctx=ctx, image=img)
+    graph = ImageGraph.from_images([img for img in ctx.config.images_enabled if only is None or img.full_image_name in only])
+    logging.debug(pformat(graph.parents))
+
+    built = {img.full_image_name: d for img in graph.images if (d := state.digest(f'build {img.full_image_name}'))}
+    stale = stale_images(ctx=ctx, graph=graph, built=built)
+
+    if not ctx.prune:
+        remove_stale(ctx=ctx, images=[img for img in graph.images if img.full_image_name in stale])
+
+    def slot(img: ContainerImage) -> str:
+        return img.manager_name(default=ctx.dbx_container_manager)
+
+    history = open_history()
+    estimates = history.estimates() if history else {}
+    default_estimate = sum(estimates.values()) / len(estimates) if estimates else 0.0
+
+    def estimate(name: str) -> float:
+        return estimates.get(name, default_estimate) if name in stale else 0.0
+
+    # start the longest chains of builds first
+    paths = graph.critical_paths(estimate)
+    records: dict[str, BuildRecord] = {}
+    records_lock = threading.Lock()
+
+    def build(img: ContainerImage) -> bool:
+        name = img.full_image_name
+        started = time.time()
+
+        if name not in stale:
+            records[name] = BuildRecord(name, slot(img), started, duration=0.0, cached=True, ok=True)
+            return True
+
+        ok = create_image(ctx=ctx, image=img)
+        state.record(f'build {name}', ok=ok, digest=image_id(manager=slot(img), image_name=name, verbose=ctx.verbose) if ok else None)
+
+        # one line per build that leaves builds to do - the summary follows the last one
+        with records_lock:
+            records[name] = BuildRecord(name, slot(img), started, duration=time.time() - started, cached=False, ok=ok)
+            if estimates and (left := [graph.image(n) for n in stale if n not in records]):
+                eta = remaining_time(left, paths, estimate, jobs=ctx.jobs, slot=slot)
+                logging.info(f'{len(stale) - len(left)}/{len(stale)} image(s) built; about {eta:.0f}s remaining')
+
+        return ok
+
+    if estimates and stale:
+        expected = remaining_time([graph.image(n) for n in stale], paths, estimate, jobs=ctx.jobs, slot=slot)
+        logging.info(f'Building {len(stale)} image(s); about {expected:.0f}s expected')
+
+    created = run_graph(graph, work=build, jobs=ctx.jobs, slot=slot, priority=lambda img: paths[img.full_image_name])
+
+    if stale:
+        logging.info(f'{sum(1 for name in stale if created.get(name))}/{len(stale)} image(s) built')
+
+    wait_for_images(ctx=ctx, images=[graph.image(name) for name in stale if created.get(name)])
 
-    logging.info('allow system to coallesce')
-    time.sleep(5)
+    if history:
+        record_history(ctx=ctx, history=history, records=list(records.values()))
+        history.close()
 
+    to_assemble: dict[str, ContainerImage] = {}
     for img in ctx.config.containers_to_assemble:
-        assemble_distrobox(ctx=ctx, image=img)
+        if only is not None and img.full_image_name not in only:
+            continue
+
+        if not created.get(img.full_image_name):
+            logging.error(f'Skipping assembling {img.distrobox_name} because {img.full_image_name} was not created')
+            continue
+
+        manager = img.manager_name(default=ctx.dbx_container_manager)
+        step = f'assemble {img.distrobox_name}'
+        if img.full_image_name not in stale and not state.failed(step) and container_exists(
+            manager=manager, name=img.distrobox_name, verbose=ctx.verbose
+        ):
+            logging.info(f'Skipping assembling {img.distrobox_name} because {img.full_image_name} is unchanged')
+            continue
+
+        if (digest := state.digest(step)) and digest == image_id(
+            manager=manager, image_name=img.full_image_name, verbose=ctx.verbose
+        ) and container_exists(manager=manager, name=img.distrobox_name, verbose=ctx.verbose):
+            logging.info(f'Skipping assembling {img.distrobox_name} - done by the interrupted run')
+            continue
+
+        to_assemble[img.distrobox_name] = img
+
+    def assemble(name: str) -> bool:
+        img = to_assemble[name]
+        ok = assemble_distrobox(ctx=ctx, image=img)
+        manager = img.manager_name(default=ctx.dbx_container_manager)
+        digest = image_id(manager=manager, image_name=img.full_image_name, verbose=ctx.verbose) if ok else None
+        state.record(f'assemble {name}', ok=ok, digest=digest)
+        return ok
+
+    assembled = for_each_concurrently(to_assemble, assemble, max_workers=ctx.assemble_jobs)
+    if failed := [name for name, ok in assembled.items() if not ok]:
+        logging.error(f'Failed to assemble: {failed}')
+
+    if failures := state.failures:
+        # cleaning would remove the base images that resuming the run rebuilds on
+        logging.warning(f'Skipping clean images - {len(failures)} step(s) failed; fix them and rerun with process --resume')
+        return
 
     if not ctx.skip_clean:
-        clean_images(ctx=ctx)
+        clean_images(ctx=ctx, keep_parents=True)
+        state.record('clean', ok=True)
     else:
         logging.warning(f'Skipping clean images - skip-clean={ctx.skip_clean}')
 
+    state.finish()
+
+
+@log_entry_exit
+def prune_manager(ctx: AppContext, manager: str) -> None:
+    if ctx.skip_podman and manager == 'podman':
+        logging.info(f'Skipping shutting down and pruning using {manager} ...')
+        return
+
+    logging.info(f'Shutting down and pruning using {manager} ...')
+    before = store_bytes(ctx=ctx, manager=manager) if ctx.metrics_file else None
+
+    running = [c.id for c in containers_running(manager=manager, verbose=ctx.verbose)]
+    stopped = containers_stop(manager=manager, names=running, timeout=ctx.stop_timeout, verbose=ctx.verbose)
+    log_batch_results(f'Stopping containers with {manager}', stopped)
+
+    prune_buildx(manager=manager, verbose=ctx.verbose)
+    prune_system(manager=manager, verbose=ctx.verbose)
+
+    if before is not None:
+        trace.tag(reclaimed=before - store_bytes(ctx=ctx, manager=manager))
+
+    logging.info(f'Shutting down and pruning using {manager} ... done.')
+
+
+@log_entry_exit
+def record_history(ctx: AppContext, history: BuildHistory, records: list[BuildRecord]) -> None:
+    """Add the size of each image that exists to its record, then save the records - one inspect per manager"""
+    by_manager: dict[str, list[BuildRecord]] = {}
+    for rec in records:
+        by_manager.setdefault(rec.manager, []).append(rec)
+
+    for manager, recs in by_manager.items():
+        infos = images_inspect(manager=manager, image_names=[rec.image for rec in recs if rec.ok], verbose=ctx.verbose)
+        sizes = {normalize_image_ref(name): info.size for info in infos for name in info.names}
+        for rec in recs:
+            rec.size = sizes.get(rec.image)
+
+    history.record(records)
+
+
+def remaining_time(
+    images: list[ContainerImage],
+    paths: dict[str, float],
+    estimate: Callable[[str], float],
+    jobs: int,
+    slot: Callable[[ContainerImage], str],
+) -> float:
+    """A lower bound of the time to build images - the longest chain left, or the work left per slot if that is longer"""
+    per_slot: dict[str, float] = {}
+    for img in images:
+        per_slot[slot(img)] = per_slot.get(slot(img), 0.0) + estimate(img.full_image_name)
+
+    return max(
+        max((paths[img.full_image_name] for img in images), default=0.0),
+        max(per_slot.values(), default=0.0) / max(jobs, 1),
+    )
+
+
+@log_entry_exit
+def remove_stale(ctx: AppContext, images: list[ContainerImage]) -> None:
+    """Stop and remove the containers of the images about to be rebuilt, then the images - one command per manager"""
+    by_manager: dict[str, list[ContainerImage]] = {}
+    for image in reversed(images):
+        by_manager.setdefault(image.manager_name(default=ctx.dbx_container_manager), []).append(image)
+
+    def remove(manager: str) -> None:
+        # most images have no container, so failing to stop or remove one is expected
+        names = [image.distrobox_name for image in by_manager[manager]]
+        log_batch_results(
+            f'Stopping {names} with {manager}',
+            containers_stop(manager=manager, names=names, timeout=ctx.stop_timeout, verbose=ctx.verbose),
+            level=logging.INFO,
+        )
+        log_batch_results(
+            f'Removing {names} with {manager}',
+            containers_remove(manager=manager, names=names, verbose=ctx.verbose),
+            level=logging.INFO,
+        )
+
+        image_names = [image.full_image_name for image in by_manager[manager]]
+        log_batch_results(
+            f'Removing images {image_names} with {manager}',
+            images_remove(manager=manager, image_names=image_names, verbose=ctx.verbose)
+        )
+
+    for_each_concurrently(by_manager, remove)
+
+
+def run_state(ctx: AppContext, only: Optional[set[str]]) -> RunState:
+    """The state of the interrupted run to resume - or a new one; only runs of all the enabled images are saved"""
+    from ocisictl.runstate import RunState, default_run_state_path
+
+    path = default_run_state_path(ctx.config_file) if only is None else None
+
+    if ctx.resume and path:
+        if (state := RunState.load(path)) is None:
+            logging.warning(f'There is no run of {ctx.config_file} to resume; starting a new run')
+        elif state.complete:
+            logging.info(f'The last run of {ctx.config_file} completed; starting a new run')
+        else:
+            logging.info(f'Resuming the run started {time.ctime(state.started)} - {len(state.steps)} step(s) recorded')
+            return state
+
+    state = RunState(path=path)
+    state.save()
+    return state
+
+
+def sharing_report(ctx: AppContext, manager: str) -> Optional[SharingReport]:
+    """Index the layers of all named images in the store of manager; None if there are none"""
+    names_by_id: dict[str, list[str]] = {}
+    for img in image_list(manager=manager, verbose=ctx.verbose):
+        names_by_id.setdefault(img.short_id, []).extend(img.names)
+
+    if not names_by_id:
+        return None
+
+    imgs = images_inspect(manager=manager, image_names=list(names_by_id), verbose=ctx.verbose)
+    for img in imgs:
+        img.names = names_by_id.get(img.short_id, img.names)
+
+    # history is per image - only ask for images that still have layers of unknown size
+    layer_sizes: dict[str, int] = {}
+    for img in sorted(imgs, key=lambda img: len(img.layers)):
+        if any(lyr not in layer_sizes for lyr in img.layers):
+            layer_sizes.update(image_layer_sizes(manager=manager, image_name=img.id, layers=img.layers, verbose=ctx.verbose))
+
+    return SharingReport.from_images(manager=manager, images=imgs, layer_sizes=layer_sizes)
+
+
+@log_entry_exit
+def stale_images(ctx: AppContext, graph: ImageGraph, built: Optional[dict[str, str]] = None) -> set[str]:
+    """The images that need to be (re)built - because their fingerprint changed or a parent needs to be rebuilt.
+
+    built maps the images built by an interrupted run to their digests; those are kept if they still exist as built.
+    """
+    stale: set[str] = set()
+
+    for level in graph.levels():
+        for img in level:
+            name = img.full_image_name
+            manager = img.manager_name(default=ctx.dbx_container_manager)
+
+            if built and name in built and not any(p in stale for p in graph.parents[name]):
+                if image_id(manager=manager, image_name=name, verbose=ctx.verbose) == built[name]:
+                    logging.info(f'{name} was built by the interrupted run; skipping')
+                    continue
+
+            if ctx.force or ctx.prune or any(p in stale for p in graph.parents[name]):
+                stale.add(name)
+                continue
+
+            label = image_label(manager=manager, image_name=name, label=FINGERPRINT_LABEL, verbose=ctx.verbose)
+            if label != image_fingerprint(ctx=ctx, image=img):
+                stale.add(name)
+            else:
+                logging.info(f'{name} is up to date with {manager}; skipping')
+
+    return stale
+
+
+def write_metrics(ctx: AppContext, metrics_file: str, started: float, ok: bool) -> None:
+    """Write the metrics of the run to metrics_file (as JSON if it ends with .json), replacing it atomically - so a
+    collector never reads part of it"""
+    from ocisictl.metrics import format_metrics, format_metrics_json, last_success, run_metrics
+
+    path = Path(metrics_file)
+    try:
+        reports = [report for manager in ctx.config.managers if (report := sharing_report(ctx=ctx, manager=manager))]
+    except Exception:
+        logging.exception('Could not report the images for the metrics')
+        reports = []
+
+    samples = run_metrics(
+        verb=ctx.verb,
+        spans=trace.spans(),
+        reports=reports,
+        images=[img.full_image_name for img in ctx.config.images],
+        distroboxes={img.full_image_name: img.distrobox_name for img in ctx.config.containers_to_assemble},
+        started=started,
+        ended=time.time(),
+        ok=ok,
+        previous_success=last_success(path, verb=ctx.verb),
+    )
+
+    try:
+        write_text_atomic(path, format_metrics_json(samples) if path.suffix == '.json' else format_metrics(samples))
+        logging.info(f'Wrote metrics to {path}')
+    except OSError as e:
+        logging.error(f'Could not write metrics to {path}: {e!r}')
+
+
+def watch(ctx: AppContext) -> None:
+    """Rebuild the images affected by each change to their directories (and their descendants) until interrupted"""
+    from ocisictl.watch import affected_images, open_watcher, wait_for_changes, watch_dirs
+
+    config_file = Path(ctx.config_file).resolve()
+
+    def rebuild(only: Optional[set[str]]) -> None:
+        logging.info(f'Processing {"all images" if only is None else sorted(only)} ...')
+        try:
+            process(ctx=ctx, only=only)
+        except Exception:
+            logging.exception('Processing failed; waiting for the next change')
+
+    try:
+        while True:
+            # changes made while processing are picked up by the next wait, as the watcher stays open
+            with open_watcher(watch_dirs(ctx.config.images_enabled, config_file=config_file), interval=ctx.poll_interval) as watcher:
+                logging.info(f'Watching for changes to {config_file.name} and the images it enables - Ctrl-C to stop')
+
+                while config_file not in (changed := wait_for_changes(watcher, debounce=ctx.debounce)):
+                    logging.debug(f'Changed: {sorted(str(p) for p in changed)}')
+                    if affected := affected_images(ctx.config.images_enabled, changed):
+                        rebuild(only=affected | ImageGraph.from_images(ctx.config.images_enabled).descendants(affected))
+
+            # the images enabled, and so the directories to watch, may have changed too
+            logging.info(f'{config_file.name} changed; reloading it')
+            ctx.config = AppConfig.from_yaml(ctx.config_file)
+            rebuild(only=None)
+    except KeyboardInterrupt:
+        logging.info('Stopped watching')
+
+
+def store_bytes(ctx: AppContext, manager: str) -> int:
+    """The bytes of the layers of the images in the store of manager - each layer counted once"""
+    report = sharing_report(ctx=ctx, manager=manager)
+    return report.unique_bytes if report else 0
+
+
+@log_entry_exit
+def sync(ctx: AppContext) -> None:
+    """Copy the images with sync_to from the store of their manager to that of the sync_to manager"""
+    copied: dict[str, bool] = {}
+
+    for img in ctx.config.images_to_sync:
+        name = img.full_image_name
+        source = img.manager_name(default=ctx.dbx_container_manager)
+        target = img.sync_to or source
+
+        if target == source:
+            logging.warning(f'Skipping syncing {name} - sync_to is its own manager ({source})')
+            continue
+
+        if not (src := image_inspect(manager=source, image_name=name, verbose=ctx.verbose)):
+            logging.error(f'Skipping syncing {name} - it does not exist with {source}; process it first')
+            copied[name] = False
+            continue
+
+        dst = image_inspect(manager=target, image_name=name, verbose=ctx.verbose)
+        if dst and dst.layers == src.layers:
+            logging.info(f'{name} is in sync with {target}; skipping')
+            continue
+
+        logging.info(f'Syncing {name} from {source} to {target} ...')
+        copied[name] = image_copy(source=source, target=target, image_name=name, verbose=ctx.verbose)
+        logging.info(f'Syncing {name} from {source} to {target} ... {"done" if copied[name] else "failed"}.')
+
+    log_batch_results('Syncing images', copied, level=logging.ERROR)
+
+
+@log_entry_exit
+def wait_for_images(ctx: AppContext, images: list[ContainerImage]) -> bool:
+    """Wait until every image is inspectable by digest, so that assembling does not race the image store"""
+    pending = {img.full_image_name: img.manager_name(default=ctx.dbx_container_manager) for img in images}
+
+    def ready() -> bool:
+        for name, manager in list(pending.items()):
+            if image_id(manager=manager, image_name=name, verbose=ctx.verbose):
+                del pending[name]
+        return not pending
+
+    is_ready, elapsed = wait_until(ready, timeout=ctx.ready_timeout)
+
+    if is_ready:
+        logging.info(f'{len(images)} image(s) ready after {elapsed:.2f}s')
+    else:
+        logging.warning(f'Timed out after {elapsed:.2f}s waiting for image(s) to be ready: {sorted(pending)}')
+
+    return is_ready
+
 
 def run_steps(ctx: AppContext) -> None:
+    for manager in ctx.engine_api:
+        use_engine_api(manager=manager)
+
     if ctx.verb == 'list':
         if ctx.list_layers:
             list_layers(ctx=ctx)
+        elif ctx.list_history:
+            list_history(ctx=ctx)
         elif ctx.list_all:
             list_all(ctx=ctx)
         elif ctx.list_assemble:
             list_assemble(ctx=ctx)
         elif ctx.list_enabled:
             list_enabled(ctx=ctx)
+        elif ctx.list_sharing:
+            list_sharing(ctx=ctx)
     elif ctx.verb == 'clean':
-        clean_images(ctx=ctx)
+        with traced(ctx=ctx):
+            clean_images(ctx=ctx)
+    elif ctx.verb == 'gc':
+        gc(ctx=ctx)
+    elif ctx.verb == 'lint':
+        from ocisictl.history import open_history
+        from ocisictl.rich import print_hoist_candidates
+
+        history = open_history()
+        estimates = history.estimates() if history else {}
+        if history:
+            history.close()
+
+        print_hoist_candidates(lint_sharing(ctx=ctx), estimates=estimates)
+    elif ctx.verb == 'sync':
+        with traced(ctx=ctx):
+            sync(ctx=ctx)
+    elif ctx.verb == 'watch':
+        watch(ctx=ctx)
+    elif ctx.plan:
+        from ocisictl.rich import print_plan
+
+        print_plan(plan_process(ctx=ctx), jobs=ctx.jobs)
     else:
-        process(ctx=ctx)
+        with traced(ctx=ctx):
+            process(ctx=ctx)
+
+
+@contextmanager
+def traced(ctx: AppContext) -> Generator[None]:
+    """Write the trace of the run to the --trace file and summarize its slowest phases, and write the --metrics file -
+    even if the run fails. Spans are only recorded when either is asked for."""
+    if not ctx.trace_file and not ctx.metrics_file:
+        yield
+        return
+
+    started = time.time()
+    ok = False
+    trace.start()
+    try:
+        yield
+        ok = True
+    finally:
+        try:
+            if metrics_file := ctx.metrics_file:
+                write_metrics(ctx=ctx, metrics_file=metrics_file, started=started, ok=ok)
+
+            if ctx.trace_file:
+                from ocisictl.rich import print_trace_summary
+
+                trace.write_trace(ctx.trace_file)
+                logging.info(f'Wrote trace to {ctx.trace_file}')
+                print_trace_summary(trace.spans())
+        finally:
+            trace.stop()
@@ -0,0 +1,132 @@
+"""Run tracing - records steps and subprocesses with their timing so a run can be analyzed afterwards"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Generator, Optional
+
+# tags that are inherited by the spans nested inside of a span
+_INHERITED_TAGS = ('manager', 'image')
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans: list[Span] = []  # noqa F821
+_recording = False
+
+
+@dataclass
+class Span:
+    """A timed unit of work - a step (cat='step'), a subprocess (cat='cmd') or an Engine API request (cat='api')"""
+
+    name: str
+    cat: str
+    start: float
+    end: float = 0.0
+    thread: str = ''
+    tags: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def manager(self) -> Optional[str]:
+        return self.tags.get('manager')
+
+    @property
+    def image(self) -> Optional[str]:
+        return self.tags.get('image')
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self.tags.get('exit_code')
+
+
+def _current_tags() -> dict[str, Any]:
+    return getattr(_local, 'tags', {})
+
+
+def _current_stack() -> list[Span]:  # noqa F821
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name: str, cat: str = 'step', **tags: Any) -> Generator[Span]:
+    """Record the duration of the with block; the span is yielded so that e.g. its exit_code tag can be set"""
+    inherited = _current_tags()
+    tags = {**inherited, **{k: v for k, v in tags.items() if v is not None}}
+    s = Span(name=name, cat=cat, start=time.time(), thread=threading.current_thread().name, tags=tags)
+
+    _local.tags = {k: v for k, v in tags.items() if k in _INHERITED_TAGS}
+    _current_stack().append(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.tags['error'] = repr(e)
+        raise
+    finally:
+        s.end = time.time()
+        _current_stack().pop()
+        _local.tags = inherited
+        if _recording:
+            with _lock:
+                _spans.append(s)
+
+
+def start() -> None:
+    """Record the spans from now on - spans are only kept while a run is traced, e.g., not by every process of watch"""
+    global _recording
+    with _lock:
+        _spans.clear()
+        _recording = True
+
+
+def stop() -> None:
+    """Stop recording and forget the recorded spans"""
+    global _recording
+    with _lock:
+        _spans.clear()
+        _recording = False
+
+
+def tag(**tags: Any) -> None:
+    """Add tags to the innermost open span of this thread - and to the spans nested inside of it from now on"""
+    if stack := _current_stack():
+        stack[-1].tags.update(tags)
+        _local.tags = {**_current_tags(), **{k: v for k, v in tags.items() if k in _INHERITED_TAGS}}
+
+
+def spans() -> list[Span]:
+    with _lock:
+        return sorted(_spans, key=lambda s: s.start)
+
+
+def write_trace(file_path: str) -> None:
+    """Write the recorded spans in the Chrome trace event format - load it with chrome://tracing or ui.perfetto.dev"""
+    recorded = spans()
+    threads = {name: tid for tid, name in enumerate(dict.fromkeys(s.thread for s in recorded), start=1)}
+
+    events: list[dict[str, Any]] = [
+        {'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}}
+        for name, tid in threads.items()
+    ]
+    events.extend(
+        {
+            'name': s.name,
+            'cat': s.cat,
+            'ph': 'X',
+            'ts': int(s.start * 1_000_000),
+            'dur': int(s.duration * 1_000_000),
+            'pid': 1,
+            'tid': threads[s.thread],
+            'args': s.tags,
+        }
+        for s in recorded
+    )
+
+    with open(file_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, indent=1, default=str)
@@ -1,28 +1,313 @@
+import json
 import logging
+import os
+import re
+import selectors
+import shlex
 import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, TypeVar
 
+from ocisictl.trace import span
 
-def cmd_output_to_terminal(cmd: str, verbose=True) -> int:
+T = TypeVar('T')
+R = TypeVar('R')
+
+_OUTPUT_LOCK = threading.Lock()
+
+# streaming output - bytes read at a time, longest line kept whole and lines kept to show when a command fails
+_READ_SIZE = 64 * 1024
+_MAX_LINE = 64 * 1024
+_TAIL_LINES = 40
+
+# lines that show the progress of a build or an assemble: podman (STEP 3/10:), BuildKit plain progress
+# (#7 [2/4] RUN ...) and distrobox
+_PROGRESS_RE = re.compile(r'^(\[\d+/\d+\] )?STEP \d+/\d+:|^#\d+ \[[^\]]*\d+/\d+\]|^#\d+ ERROR|^ ?- Creating|(?i:successfully)')
+
+_SIZE_RE = re.compile(r'^\s*([\d.]+)\s*([a-zA-Z]*)\s*$')
+_SIZE_UNITS = {
+    '': 1, 'b': 1,
+    'kb': 1000, 'mb': 1000**2, 'gb': 1000**3, 'tb': 1000**4,
+    'k': 1024, 'm': 1024**2, 'g': 1024**3, 't': 1024**4,
+    'kib': 1024, 'mib': 1024**2, 'gib': 1024**3, 'tib': 1024**4,
+}
+
+
+def _cmd_name(cmd: str) -> str:
+    """The span name of a command - the program and its (sub)command, e.g. docker buildx build"""
+    words = cmd.split()
+    return ' '.join(words[: next((i for i, w in enumerate(words[1:4], 1) if w.startswith('-')), 3)])
+
+
+def cmd_output_to_terminal(cmd: str, verbose=True, cwd: Optional[str] = None) -> int:
+    if verbose:
+        logging.info(cmd)
+
+    with span(_cmd_name(cmd), cat='cmd', cmd=cmd) as s:
+        rc = s.tags['exit_code'] = subprocess.call(cmd, shell=True, text=verbose, cwd=cwd)
+
+    if rc != 0:
+        logging.warning(f'{_cmd_name(cmd)} failed: {rc=}')
+
+    return rc
+
+
+def cmd_capture(args: list[str], verbose=True) -> subprocess.CompletedProcess[str]:
+    """Run args (without a shell) capturing its stdout and stderr"""
+    cmd = shlex.join(args)
     if verbose:
         logging.info(cmd)
 
-    return subprocess.call(cmd, shell=True, text=verbose)
+    with span(_cmd_name(cmd), cat='cmd', cmd=cmd) as s:
+        proc = subprocess.run(args, text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        s.tags['exit_code'] = proc.returncode
+
+    return proc
 
 
-def cmd_with_output(cmd: str, verbose=True) -> str:
+def cmd_pipe(src_args: list[str], dst_args: list[str], verbose=True) -> int:
+    """Run src_args | dst_args (without a shell) - the output of src_args is not copied through this process.
+
+    Returns the first non-zero exit code, e.g., of src_args if it fails part way and dst_args loads nothing.
+    """
+    cmd = f'{shlex.join(src_args)} | {shlex.join(dst_args)}'
     if verbose:
         logging.info(cmd)
 
-    return subprocess.check_output(cmd, shell=True, text=True)
+    with span(_cmd_name(shlex.join(src_args)), cat='cmd', cmd=cmd) as s:
+        src = subprocess.Popen(src_args, stdout=subprocess.PIPE)
+        try:
+            dst = subprocess.Popen(dst_args, stdin=src.stdout)
+        finally:
+            # only dst reads the pipe now - src gets SIGPIPE if dst exits early
+            if src.stdout:
+                src.stdout.close()
+
+        rc = dst.wait()
+        rc = src.wait() or rc
+        s.tags['exit_code'] = rc
+
+    if rc != 0:
+        logging.warning(f'{cmd} failed: {rc=}')
+
+    return rc
+
+
+def cmd_json(args: list[str], verbose=True) -> list[dict[str, Any]]:
+    """Run args (without a shell) and parse stdout as either a JSON array or JSON lines - one object per line.
+
+    Whatever was written to stdout is parsed even if the command fails, e.g. inspecting several names when one is missing.
+    """
+    proc = cmd_capture(args=args, verbose=verbose)
+    if proc.returncode != 0:
+        logging.debug(f'{args[:2]} {proc.returncode=}: {proc.stderr.strip()}')
+
+    out = proc.stdout.strip()
+    if not out:
+        return []
+
+    if out.startswith('['):
+        return json.loads(out)
+
+    return [json.loads(line) for line in out.splitlines() if line.strip()]
+
+
+def cmd_output_prefixed(
+    cmd: str,
+    prefix: str,
+    verbose=True,
+    cwd: Optional[str] = None,
+    log_file: Optional[Path] = None,
+    progress=False,
+) -> int:
+    """Like cmd_output_to_terminal, but stream the output of cmd and print each line prefixed with prefix.
+
+    stdout and stderr are read through non-blocking pipes a chunk at a time, so memory stays bounded however much
+    output there is. Every line is written to log_file, if given. With progress only the lines that mark the progress
+    of a build (e.g., STEP 3/10) are printed - plus the last lines of output if cmd fails.
+    Lines from concurrently running commands never interleave mid-line.
+    """
+    if verbose:
+        logging.info(f'{prefix}: {cmd}')
+
+    tail: deque[str] = deque(maxlen=_TAIL_LINES)
+
+    with ExitStack() as stack:
+        s = stack.enter_context(span(_cmd_name(cmd), cat='cmd', cmd=cmd))
+        log = stack.enter_context(open(log_file, 'w', errors='replace')) if log_file else None
+
+        def emit(raw: bytes) -> None:
+            # keep what a progress bar redrawing itself with \r ended up showing
+            line = raw.decode(errors='replace').rstrip('\r').rpartition('\r')[2].rstrip()
+            tail.append(line)
+            if log:
+                log.write(f'{line}\n')
+            if not progress or _PROGRESS_RE.search(line):
+                with _OUTPUT_LOCK:
+                    sys.stdout.write(f'{prefix} | {line}\n')
+                    sys.stdout.flush()
+
+        with subprocess.Popen(cmd, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+            sel = stack.enter_context(selectors.DefaultSelector())
+            for pipe in (proc.stdout, proc.stderr):
+                assert pipe is not None
+                os.set_blocking(pipe.fileno(), False)
+                sel.register(pipe, selectors.EVENT_READ, data=bytearray())
+
+            while sel.get_map():
+                for key, _ in sel.select():
+                    buf: bytearray = key.data
+                    chunk = os.read(key.fd, _READ_SIZE)
+
+                    if not chunk:
+                        if buf:
+                            emit(bytes(buf))
+                        sel.unregister(key.fileobj)
+                        continue
+
+                    buf += chunk
+                    *lines, rest = buf.split(b'\n')
+                    for line in lines:
+                        emit(bytes(line))
+
+                    # a line that never ends is cut, rather than buffered without bound
+                    if len(rest) > _MAX_LINE:
+                        emit(bytes(rest))
+                        rest = bytearray()
+                    buf[:] = rest
+
+        s.tags['exit_code'] = proc.returncode
+
+    if proc.returncode != 0:
+        if progress:
+            with _OUTPUT_LOCK:
+                sys.stdout.writelines(f'{prefix} | {line}\n' for line in tail)
+                sys.stdout.flush()
+        if log_file:
+            logging.warning(f'{prefix}: {_cmd_name(cmd)} failed: rc={proc.returncode}; see {log_file}')
+
+    return proc.returncode
+
+
+def cmd_with_output(cmd: str, verbose=True, check=True) -> str:
+    """Return the stdout of cmd; if not check then failures (and their stderr) are swallowed and '' returned"""
+    if verbose:
+        logging.info(cmd)
+
+    with span(_cmd_name(cmd), cat='cmd', cmd=cmd) as s:
+        proc = subprocess.run(
+            cmd, shell=True, text=True, stdout=subprocess.PIPE, stderr=None if check else subprocess.DEVNULL
+        )
+        s.tags['exit_code'] = proc.returncode
+
+    if check:
+        proc.check_returncode()
+    elif proc.returncode != 0:
+        logging.debug(f'{_cmd_name(cmd)} {proc.returncode=}')
+
+    return proc.stdout if proc.returncode == 0 else ''
+
+
+def for_each_concurrently(items: Iterable[T], func: Callable[[T], R], max_workers: Optional[int] = None) -> dict[T, R]:
+    """Call func for every item in its own thread (at most max_workers at a time) and wait for all of them.
+
+    Every item runs to completion even if another raises; the first exception is then re-raised.
+    """
+    items = list(items)
+    results: dict[T, R] = {}
+    error: Optional[BaseException] = None
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(items), 1)) as pool:
+        futures = {item: pool.submit(func, item) for item in items}
+
+        for item, future in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                logging.error(f'{item}: {e!r}')
+                error = error or e
+
+    if error:
+        raise error
+
+    return results
+
+
+def format_size(size: float) -> str:
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(size) < 1000:
+            return f'{size:.1f}{unit}' if unit != 'B' else f'{size:.0f}B'
+        size /= 1000
+    return f'{size:.1f}TB'
 
 
 def log_entry_exit(func):
+    """Log and trace the step func; the manager and image keyword args of the step tag its span"""
+
     @wraps(func)
     def wrapper(*args, **kwargs):
+        manager = kwargs.get('manager')
+        image = getattr(kwargs.get('image'), 'full_image_name', None)
+
         logging.debug(f'{func.__name__} starting')
-        rc = func(*args, **kwargs)
+        with span(func.__name__, manager=manager if isinstance(manager, str) else None, image=image) as s:
+            rc = func(*args, **kwargs)
+            if isinstance(rc, bool):
+                s.tags['ok'] = rc
         logging.debug(f'{func.__name__} done')
         return rc
 
     return wrapper
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float, delay: float = 0.1, max_delay: float = 2.0) -> tuple[bool, float]:
+    """Poll predicate with exponential backoff until it is true or timeout seconds elapse; returns (ready, elapsed)"""
+    start = time.monotonic()
+
+    while True:
+        if predicate():
+            return True, time.monotonic() - start
+
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            return False, elapsed
+
+        time.sleep(min(delay, timeout - elapsed))
+        delay = min(delay * 2, max_delay)
+
+
+def parse_size(size: str) -> int:
+    """Parse sizes like 1.2GB (decimal, as reported by docker), 40G or 40GiB (binary) into bytes"""
+    m = _SIZE_RE.match(size)
+    if not m or m.group(2).lower() not in _SIZE_UNITS:
+        raise ValueError(f'invalid size: {size!r}')
+
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).lower()])
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """Write text to a temporary file in the directory of path and rename it over path - a crash leaves the old file or
+    the new one, never a truncated one. The permissions of an existing path (e.g., executable) are kept."""
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            os.chmod(tmp, path.stat().st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
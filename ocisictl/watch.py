@@ -0,0 +1,189 @@
+"""Watch the image directories and config file for changes - with inotify where available, polling otherwise"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from ocisictl.containerfile import copy_sources
+from ocisictl.models import ContainerImage
+
+# from sys/inotify.h
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT = struct.Struct('iIII')
+
+
+def _dirs(paths: Iterable[Path]) -> list[Path]:
+    """Each directory in paths and all of its subdirectories"""
+    found: list[Path] = []
+    for path in paths:
+        found.extend(Path(root) for root, _, _ in os.walk(path))
+    return list(dict.fromkeys(found))
+
+
+class PollingWatcher:
+    """Compares the modification time and size of every file in the watched directories every interval seconds"""
+
+    def __init__(self, dirs: list[Path], interval: float = 1.0) -> None:
+        self.dirs = dirs
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def __enter__(self) -> PollingWatcher:  # noqa F821
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+    def _scan(self) -> dict[Path, tuple[int, int]]:
+        snapshot: dict[Path, tuple[int, int]] = {}
+        for d in self.dirs:
+            if not d.is_dir():
+                continue
+            for entry in os.scandir(d):
+                if entry.is_file():
+                    st = entry.stat()
+                    snapshot[Path(entry.path)] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def poll(self, timeout: float) -> set[Path]:
+        time.sleep(min(timeout, self.interval))
+
+        snapshot = self._scan()
+        changed = {p for p in snapshot.keys() | self._snapshot.keys() if snapshot.get(p) != self._snapshot.get(p)}
+        self._snapshot = snapshot
+
+        return changed
+
+
+class InotifyWatcher:
+    """Uses the Linux inotify API (through libc) - woken up by the kernel as soon as a file is written"""
+
+    def __init__(self, dirs: list[Path]) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self._wds: dict[int, Path] = {}
+        for d in dirs:
+            self._add_watch(d)
+
+    def __enter__(self) -> InotifyWatcher:  # noqa F821
+        return self
+
+    def __exit__(self, *exc) -> None:
+        os.close(self._fd)
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {path}')
+        self._wds[wd] = path
+
+    def poll(self, timeout: float) -> set[Path]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed: set[Path] = set()
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT.unpack_from(buf, offset)
+            name = buf[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                # events were lost - report every watched directory as changed
+                changed.update(self._wds.values())
+                continue
+
+            if (d := self._wds.get(wd)) is None:
+                continue
+
+            path = d / os.fsdecode(name)
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    for sub in _dirs([path]):
+                        try:
+                            self._add_watch(sub)
+                        except OSError as e:
+                            logging.debug(f'{sub}: {e!r}')  # e.g., already removed again
+                continue
+
+            changed.add(path)
+
+        return changed
+
+
+Watcher = InotifyWatcher | PollingWatcher
+
+
+def open_watcher(dirs: list[Path], interval: float = 1.0) -> Watcher:
+    """Watch the files directly in dirs (but not in their subdirectories - list those too)"""
+    try:
+        watcher = InotifyWatcher(dirs)
+        logging.info(f'Watching {len(dirs)} directories with inotify')
+        return watcher
+    except (OSError, AttributeError) as e:
+        logging.info(f'inotify is not available ({e!r}); polling {len(dirs)} directories every {interval}s')
+        return PollingWatcher(dirs, interval=interval)
+
+
+def wait_for_changes(watcher: Watcher, debounce: float) -> set[Path]:
+    """Block until something changes, then until nothing has changed for debounce seconds - e.g., a burst of saves"""
+    changed: set[Path] = set()
+    while not changed:
+        changed = watcher.poll(timeout=60.0)
+
+    deadline = time.monotonic() + debounce
+    while (left := deadline - time.monotonic()) > 0:
+        if more := watcher.poll(timeout=left):
+            changed |= more
+            deadline = time.monotonic() + debounce
+
+    return changed
+
+
+def affected_images(images: list[ContainerImage], changed: set[Path]) -> set[str]:
+    """The images (by full_image_name) built from a changed Containerfile or copying in a changed file"""
+    changed = {p.resolve() for p in changed}
+    affected: set[str] = set()
+
+    for img in images:
+        inputs: set[Path] = {img.container_file_path.resolve()}
+        if img.container_file_path.exists():
+            inputs |= {(Path(img.path) / src).resolve() for src in copy_sources(img.container_file_path, img.build_args())}
+
+        if any(p.is_relative_to(i) for p in changed for i in inputs):
+            affected.add(img.full_image_name)
+
+    return affected
+
+
+def watch_dirs(images: list[ContainerImage], config_file: Optional[Path]) -> list[Path]:
+    """The path directories of images (and their subdirectories) - and the directory of the config file"""
+    dirs = _dirs(Path(img.path).resolve() for img in images if Path(img.path).is_dir())
+    if config_file:
+        dirs.append(config_file.resolve().parent)
+    return list(dict.fromkeys(dirs))
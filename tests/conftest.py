@@ -0,0 +1,70 @@
+import json
+import statistics
+from pathlib import Path
+
+import pytest
+
+# the timings of the bench tests by size and case, e.g. {'100': {'process': [1.2, 1.1, 1.3]}}
+BENCH_RESULTS: dict[str, dict[str, list[float]]] = {}
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup('bench', 'end to end benchmarks against fake_manager.py')
+    group.addoption('--bench', action='store_true', default=False, help='run the benchmarks (tests marked bench)')
+    group.addoption('--bench-sizes', default='10,100,1000', help='the numbers of images in the synthetic configs')
+    group.addoption('--bench-rounds', type=int, default=3, help='the number of times each case is run')
+    group.addoption('--bench-jobs', type=int, default=4, help='passed to process --jobs')
+    group.addoption('--bench-latency', type=float, default=0.0, help='seconds every fake manager command takes')
+    group.addoption('--bench-build-seconds', type=float, default=0.05, help='seconds every fake build and assemble takes')
+    group.addoption('--bench-save', metavar='FILE', help='write the timings to FILE as JSON')
+    group.addoption('--bench-compare', metavar='FILE', help='fail a case whose median is slower than the one saved in FILE')
+    group.addoption('--bench-tolerance', type=float, default=0.1, help='the fraction a median may be slower than the saved one')
+    group.addoption('--startup-runs', type=int, default=10, help='the number of times list --enabled is timed')
+    group.addoption('--startup-budget-ms', type=float, default=200.0, help='the median start up time list --enabled may take')
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line('markers', 'bench: an end to end benchmark - only run with --bench')
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    if 'bench_size' in metafunc.fixturenames:
+        sizes = [int(s) for s in metafunc.config.getoption('--bench-sizes').split(',')]
+        metafunc.parametrize('bench_size', sizes, ids=[f'{s}-images' for s in sizes], scope='module')
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]) -> None:
+    if config.getoption('--bench'):
+        return
+
+    skip = pytest.mark.skip(reason='benchmarks only run with --bench')
+    for item in items:
+        if 'bench' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def bench_results() -> dict[str, dict[str, list[float]]]:
+    return BENCH_RESULTS
+
+
+@pytest.fixture(scope='session')
+def bench_baseline(pytestconfig: pytest.Config) -> dict[str, dict[str, list[float]]]:
+    compare = pytestconfig.getoption('--bench-compare')
+    return json.loads(Path(compare).read_text()) if compare else {}
+
+
+def pytest_terminal_summary(terminalreporter: pytest.TerminalReporter, config: pytest.Config) -> None:
+    if not BENCH_RESULTS:
+        return
+
+    terminalreporter.section('bench')
+    terminalreporter.write_line(f'{"images":>6}  {"case":<20} {"min":>9} {"median":>9} {"max":>9}')
+    for size, times in BENCH_RESULTS.items():
+        for case, runs in times.items():
+            terminalreporter.write_line(
+                f'{size:>6}  {case:<20} {min(runs):>8.2f}s {statistics.median(runs):>8.2f}s {max(runs):>8.2f}s'
+            )
+
+    if save := config.getoption('--bench-save'):
+        Path(save).write_text(json.dumps(BENCH_RESULTS, indent=2))
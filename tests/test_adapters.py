@@ -0,0 +1,94 @@
+"""The batched manager commands against a canned manager - which names failed is taken from stderr or re-checked"""
+
+import subprocess
+
+import pytest
+
+from ocisictl import adapters
+
+
+def fake_capture(monkeypatch: pytest.MonkeyPatch, returncode: int, stderr: str) -> list[list[str]]:
+    calls: list[list[str]] = []
+
+    def cmd_capture(args: list[str], verbose: bool = True) -> subprocess.CompletedProcess[str]:
+        calls.append(args)
+        return subprocess.CompletedProcess(args, returncode, stdout='', stderr=stderr)
+
+    monkeypatch.setattr(adapters, 'cmd_capture', cmd_capture)
+    return calls
+
+
+def test_batch_ok(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = fake_capture(monkeypatch, 0, '')
+
+    removed = adapters.images_remove('podman', ['fedora-go:latest', 'fedora-go-dx:latest'], verbose=False)
+
+    assert removed == {'fedora-go:latest': True, 'fedora-go-dx:latest': True}
+    assert calls == [['podman', 'rmi', '-f', 'fedora-go:latest', 'fedora-go-dx:latest']]
+
+
+def test_batch_attributes_whole_references(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_capture(monkeypatch, 2, 'Error: cannot remove container fedora-go-dx as it is running\n')
+    monkeypatch.setattr(adapters, 'container_exists', lambda manager, name, verbose: False)
+
+    removed = adapters.containers_remove('podman', ['fedora-go', 'fedora-go-dx'], verbose=False)
+
+    assert removed == {'fedora-go': True, 'fedora-go-dx': False}
+
+
+def test_batch_rechecks_unattributed(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_capture(monkeypatch, 1, 'Error: 1 error occurred:\n\t* image is in use by a container\n')
+    present = {'fedora-python:latest'}
+    monkeypatch.setattr(adapters, 'image_id', lambda manager, image_name, verbose: 'sha256:1' if image_name in present else None)
+
+    removed = adapters.images_remove('podman', ['fedora-python:latest', 'fedora-python314:latest'], verbose=False)
+
+    assert removed == {'fedora-python:latest': False, 'fedora-python314:latest': True}
+
+
+def test_batch_stop_rechecks_running(monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_capture(monkeypatch, 1, 'Error: something went wrong\n')
+    running = [adapters.ContainerInfo(id='abc123', names=['fedora-go-dx'], image='fedora-go-dx:latest', state='running')]
+    monkeypatch.setattr(adapters, 'containers_running', lambda manager, verbose: running)
+
+    stopped = adapters.containers_stop('docker', ['fedora-go', 'fedora-go-dx'], timeout=1, verbose=False)
+
+    assert stopped == {'fedora-go': True, 'fedora-go-dx': False}
+
+
+def test_image_build_with_cache_loads_the_image(monkeypatch: pytest.MonkeyPatch) -> None:
+    cmds: list[str] = []
+
+    def cmd_output_prefixed(cmd: str, **kwargs: object) -> int:
+        cmds.append(cmd)
+        return 0
+
+    monkeypatch.setattr(adapters, 'cmd_output_prefixed', cmd_output_prefixed)
+
+    adapters.image_build(
+        manager='docker',
+        container_file='Containerfile.fedora-go',
+        image_name='fedora-go:latest',
+        build_args={'IMG': 'fedora-dev-base'},
+        labels={'ocisictl.fingerprint': 'abc'},
+        context_dir='fedora',
+        verbose=False,
+        cache_from='type=local,src=/cache/fedora-go_latest',
+        cache_to='type=local,dest=/cache/fedora-go_latest.new,mode=max',
+    )
+    adapters.image_build(
+        manager='podman',
+        container_file='Containerfile.fedora-go',
+        image_name='fedora-go:latest',
+        build_args={},
+        labels={},
+        context_dir='fedora',
+        verbose=False,
+    )
+
+    assert cmds == [
+        'docker buildx build -f Containerfile.fedora-go -t fedora-go:latest --build-arg IMG=fedora-dev-base'
+        ' --label ocisictl.fingerprint=abc --cache-from type=local,src=/cache/fedora-go_latest'
+        ' --cache-to type=local,dest=/cache/fedora-go_latest.new,mode=max --load .',
+        'podman buildx build -f Containerfile.fedora-go -t fedora-go:latest  .',
+    ]
@@ -0,0 +1,180 @@
+"""Benchmark ocisictl end to end against fake_manager.py for synthetic configs of increasing size.
+
+For each size (--bench-sizes) a config with that many images is generated - base images, images built on them and -dx
+images on top of some of those, split between docker and podman. Each case runs --bench-rounds times:
+
+    process              builds every image and assembles the -dx distroboxes, starting from an empty fake manager
+    process (no change)  the same again, with every image up to date
+    list --layers        reports the layers shared by the images
+    clean                removes the images
+
+Run with `pytest --bench`. Use --bench-save FILE to keep the timings and --bench-compare FILE to fail the cases whose
+median is slower than the saved one by more than --bench-tolerance, e.g., to check whether a change to the scheduling
+in steps.py speeds things up. A case whose ocisictl run fails fails too.
+"""
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+pytestmark = pytest.mark.bench
+
+REPO = Path(__file__).resolve().parents[1]
+FAKE_MANAGER = REPO / '.uvextras' / 'scripts' / 'fake_manager.py'
+
+CONTAINERFILE_DX = '''ARG IMG="bench-base-0"
+ARG TAG="latest"
+
+FROM $IMG:$TAG
+ARG USER
+
+RUN useradd ${USER}
+USER ${USER}
+'''
+
+
+@dataclass
+class Bench:
+    size: int
+    root: Path
+    config: Path
+    env: dict[str, str]
+    rounds: int
+    jobs: int
+    results: dict[str, list[float]]
+    baseline: dict[str, list[float]]
+    tolerance: float
+
+    def reset(self) -> None:
+        """Start over from an empty fake manager"""
+        shutil.rmtree(self.env['FAKE_MANAGER_STATE'], ignore_errors=True)
+
+    def run(self, *verb: str) -> float:
+        """Run ocisictl verb and return how long it took; fails the test if it fails"""
+        opts = ['-j', str(self.jobs)] if verb[0] == 'process' else []
+        cmd = [sys.executable, '-m', 'ocisictl', *verb, *opts, '-f', str(self.config)]
+
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, env=self.env, cwd=self.root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = time.perf_counter() - start
+
+        if proc.returncode != 0:
+            pytest.fail(f'{" ".join(verb)}: rc={proc.returncode}\n{proc.stderr[-2000:]}')
+
+        return elapsed
+
+    def record(self, case: str, runs: list[float]) -> None:
+        self.results[case] = runs
+
+        if (saved := self.baseline.get(case)) and statistics.median(runs) > statistics.median(saved) * (1 + self.tolerance):
+            pytest.fail(
+                f'{case}: median {statistics.median(runs):.2f}s is slower than the saved {statistics.median(saved):.2f}s '
+                f'by more than {self.tolerance:.0%}'
+            )
+
+
+def write_config(root: Path, size: int) -> Path:
+    """Write a config of size images (and their Containerfiles) in root"""
+    img_dir = root / 'bench'
+    img_dir.mkdir(parents=True)
+    (img_dir / 'Containerfile.img-dx').write_text(CONTAINERFILE_DX)
+
+    bases = max(1, size // 20)
+    dxs = size // 6
+    children = size - bases - dxs
+
+    def manager(base: int) -> str:
+        return 'podman' if base % 2 == 0 else 'docker'
+
+    lines: list[str] = []
+    for b in range(bases):
+        (img_dir / f'Containerfile.bench-base-{b}').write_text(
+            f'FROM quay.io/fedora/fedora:43\n\nRUN dnf install -y git {b}\nRUN dnf install -y gcc {b}\nRUN dnf clean all\n'
+        )
+        lines += [f'- name: bench-base-{b}', '  path: bench', f'  manager: {manager(b)}', '  enabled: true']
+
+    for c in range(children):
+        (img_dir / f'Containerfile.bench-{c}').write_text(f'FROM bench-base-{c % bases}:latest\n\nRUN dnf install -y tool-{c}\n')
+        lines += [f'- name: bench-{c}', '  path: bench', f'  manager: {manager(c % bases)}', '  enabled: true']
+
+    for d in range(dxs):
+        lines += [f'- name: bench-{d}-dx', '  path: bench', f'  manager: {manager(d % bases)}', '  enabled: true']
+
+    config = root / 'bench.yaml'
+    config.write_text('\n'.join(lines) + '\n')
+    return config
+
+
+@pytest.fixture(scope='module')
+def bench(
+    bench_size: int,
+    pytestconfig: pytest.Config,
+    bench_results: dict[str, dict[str, list[float]]],
+    bench_baseline: dict[str, dict[str, list[float]]],
+    tmp_path_factory: pytest.TempPathFactory,
+) -> Generator[Bench]:
+    root = tmp_path_factory.mktemp(f'bench-{bench_size}')
+    config = write_config(root, bench_size)
+    subprocess.run([sys.executable, str(FAKE_MANAGER), 'install', str(root / 'bin')], check=True, stdout=subprocess.DEVNULL)
+
+    env = {
+        **os.environ,
+        'PATH': f'{root / "bin"}{os.pathsep}{os.environ.get("PATH", "")}',
+        'PYTHONPATH': str(REPO),
+        'XDG_CACHE_HOME': str(root / 'cache'),
+        'XDG_STATE_HOME': str(root / 'state'),
+        'FAKE_MANAGER_STATE': str(root / 'fake'),
+        'FAKE_MANAGER_LATENCY': str(pytestconfig.getoption('--bench-latency')),
+        'FAKE_MANAGER_BUILD_SECONDS': str(pytestconfig.getoption('--bench-build-seconds')),
+        'FAKE_MANAGER_FAILURE_RATE': '0',
+    }
+
+    yield Bench(
+        size=bench_size,
+        root=root,
+        config=config,
+        env=env,
+        rounds=pytestconfig.getoption('--bench-rounds'),
+        jobs=pytestconfig.getoption('--bench-jobs'),
+        results=bench_results.setdefault(str(bench_size), {}),
+        baseline=bench_baseline.get(str(bench_size), {}),
+        tolerance=pytestconfig.getoption('--bench-tolerance'),
+    )
+
+
+def test_process(bench: Bench) -> None:
+    runs: list[float] = []
+    for _ in range(bench.rounds):
+        bench.reset()
+        runs.append(bench.run('process', '-s'))
+
+    bench.record('process', runs)
+
+
+def test_process_no_change(bench: Bench) -> None:
+    bench.reset()
+    bench.run('process', '-s')
+
+    bench.record('process (no change)', [bench.run('process', '-s') for _ in range(bench.rounds)])
+
+
+def test_list_layers(bench: Bench) -> None:
+    bench.record('list --layers', [bench.run('list', '--layers') for _ in range(bench.rounds)])
+
+
+def test_clean(bench: Bench) -> None:
+    runs: list[float] = []
+    for _ in range(bench.rounds):
+        bench.reset()
+        bench.run('process', '-s')
+        runs.append(bench.run('clean'))
+
+    bench.record('clean', runs)
@@ -0,0 +1,54 @@
+"""The --cache-dir entry of an image - replaced by the export of a build that succeeds, left alone by one that does not"""
+
+import argparse
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from ocisictl import steps
+from ocisictl.models import AppConfig, AppContext, ContainerImage
+
+
+def create_image(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, build: Callable[[], int]) -> tuple[Path, Callable[[], bool]]:
+    """Run create_image with an image_build that exports the cache and then calls build; returns the cache dir"""
+    cache_dir = tmp_path / 'cache'
+    image = ContainerImage(name='fedora-go', path=str(tmp_path), manager='docker', enabled=True)
+
+    def image_build(cache_to: str, **kwargs: Any) -> int:
+        dest = Path(dict(kv.split('=', 1) for kv in cache_to.split(','))['dest'])
+        dest.mkdir(parents=True)
+        (dest / 'index.json').write_text('{}')
+        return build()
+
+    monkeypatch.setattr(steps, 'image_build', image_build)
+    monkeypatch.setattr(steps, 'image_fingerprint', lambda ctx, image: 'sha256:fingerprint')
+
+    args = argparse.Namespace(verb='process', file='ocisictl.yaml', verbose=False, cache_dir=str(cache_dir))
+    ctx = AppContext(args=args, config=AppConfig(images=[image]))
+    return cache_dir, lambda: steps.create_image(ctx=ctx, image=image)
+
+
+def test_cache_committed_on_success(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir, create = create_image(tmp_path, monkeypatch, lambda: 0)
+
+    assert create()
+    assert sorted(p.name for p in cache_dir.iterdir()) == ['fedora-go_latest']
+
+
+def test_cache_discarded_on_failure(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cache_dir, create = create_image(tmp_path, monkeypatch, lambda: 1)
+
+    assert not create()
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_cache_discarded_on_interrupt(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def interrupted() -> int:
+        raise KeyboardInterrupt
+
+    cache_dir, create = create_image(tmp_path, monkeypatch, interrupted)
+
+    with pytest.raises(KeyboardInterrupt):
+        create()
+    assert list(cache_dir.iterdir()) == []
@@ -0,0 +1,150 @@
+"""EngineApiClient against a fake daemon - a threaded HTTP/1.1 server on a unix socket"""
+
+import http.server
+import json
+import socketserver
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Generator
+
+import pytest
+
+from ocisictl.engine_api import EngineApiClient, EngineApiError
+
+
+class FakeDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str) -> None:
+        super().__init__(socket_path, FakeDaemonHandler)
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+class FakeDaemonHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the daemons
+    server: FakeDaemon
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def address_string(self) -> str:
+        return 'unix'  # client_address of a unix socket is empty
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def send_json(self, status: int, body: object) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == '/_ping':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'OK')
+        elif self.path == '/images/json':
+            self.send_json(200, [{'Id': 'sha256:1', 'RepoTags': ['fedora-dev-base:latest']}])
+        elif self.path == '/drop':
+            # answer, then close the connection without telling the client - as a daemon does with an idle connection
+            self.send_json(200, {'dropped': True})
+            self.close_connection = True
+        elif self.path == '/slow':
+            with self.server.lock:
+                self.server.in_flight += 1
+                self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+            time.sleep(0.05)
+            with self.server.lock:
+                self.server.in_flight -= 1
+            self.send_json(200, {'slow': True})
+        else:
+            self.send_json(404, {'message': f'no such object: {self.path}'})
+
+
+@pytest.fixture
+def daemon() -> Generator[FakeDaemon]:
+    # tmp_path can be longer than a unix socket path may be
+    with tempfile.TemporaryDirectory(prefix='ocisictl-api-') as tmp:
+        server = FakeDaemon(str(Path(tmp) / 'engine.sock'))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test_request_ok(daemon: FakeDaemon) -> None:
+    client = EngineApiClient(daemon.socket_path, timeout=5.0, pool_size=1)
+
+    assert client.ping()
+    assert client.image_list() == [{'Id': 'sha256:1', 'RepoTags': ['fedora-dev-base:latest']}]
+    assert daemon.connections == 1
+
+    client.close()
+
+
+def test_request_not_found(daemon: FakeDaemon) -> None:
+    client = EngineApiClient(daemon.socket_path, timeout=5.0, pool_size=1)
+
+    with pytest.raises(EngineApiError) as exc_info:
+        client.request('GET', '/containers/missing/json')
+    assert exc_info.value.status == 404
+    assert 'no such object' in str(exc_info.value)
+
+    # unless 404 is expected
+    assert client.container_inspect('missing') is None
+
+    client.close()
+
+
+def test_request_reconnects_after_drop(daemon: FakeDaemon) -> None:
+    client = EngineApiClient(daemon.socket_path, timeout=5.0, pool_size=1)
+
+    assert client.request('GET', '/drop') == (200, {'dropped': True})
+    assert client.ping()
+    assert daemon.connections == 2
+
+    client.close()
+
+
+def test_ping_unreachable() -> None:
+    client = EngineApiClient('/nonexistent/engine.sock', timeout=1.0, pool_size=1)
+
+    assert not client.ping()
+
+
+def test_concurrent_requests_share_pool(daemon: FakeDaemon) -> None:
+    client = EngineApiClient(daemon.socket_path, timeout=5.0, pool_size=2)
+    results: list[tuple[int, object]] = []
+
+    def call() -> None:
+        result = client.request('GET', '/slow')
+        with daemon.lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [(200, {'slow': True})] * 8
+    assert daemon.max_in_flight <= 2
+    assert daemon.connections == 2
+
+    client.close()
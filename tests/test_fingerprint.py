@@ -0,0 +1,44 @@
+"""Build fingerprints - parents built from the config are hashed by digest, external parents by reference only"""
+
+import argparse
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from ocisictl import steps
+from ocisictl.models import AppConfig, AppContext, ContainerImage
+
+
+@pytest.fixture
+def images(tmp_path: Path) -> list[ContainerImage]:
+    (tmp_path / 'Containerfile.base').write_text('FROM quay.io/fedora/fedora:43\n\nRUN dnf update -y\n')
+    (tmp_path / 'Containerfile.child').write_text('FROM base:latest\n\nRUN dnf install -y git\n')
+    return [ContainerImage(name=name, path=str(tmp_path), enabled=True) for name in ('base', 'child')]
+
+
+def fingerprints(images: list[ContainerImage], digests: dict[str, str], monkeypatch: pytest.MonkeyPatch) -> dict[str, str]:
+    def image_id(manager: str, image_name: str, verbose: bool) -> Optional[str]:
+        return digests.get(image_name)
+
+    monkeypatch.setattr(steps, 'image_id', image_id)
+
+    args = argparse.Namespace(verb='process', file='ocisictl.yaml', verbose=False)
+    ctx = AppContext(args=args, config=AppConfig(images=images))
+    return {img.name: steps.image_fingerprint(ctx=ctx, image=img) for img in images}
+
+
+def test_external_parent_hashed_by_reference(images: list[ContainerImage], monkeypatch: pytest.MonkeyPatch) -> None:
+    # the first build pulls quay.io/fedora/fedora:43 - which must not change the fingerprint of base
+    before = fingerprints(images, {'base:latest': 'sha256:base'}, monkeypatch)
+    after = fingerprints(images, {'base:latest': 'sha256:base', 'quay.io/fedora/fedora:43': 'sha256:fedora'}, monkeypatch)
+
+    assert before == after
+
+
+def test_configured_parent_hashed_by_digest(images: list[ContainerImage], monkeypatch: pytest.MonkeyPatch) -> None:
+    before = fingerprints(images, {'base:latest': 'sha256:base'}, monkeypatch)
+    after = fingerprints(images, {'base:latest': 'sha256:rebuilt'}, monkeypatch)
+
+    assert before['base'] == after['base']
+    assert before['child'] != after['child']
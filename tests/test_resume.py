@@ -0,0 +1,70 @@
+"""stale_images when resuming a run - the images the interrupted run built are kept while they exist as built"""
+
+import argparse
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from ocisictl import steps
+from ocisictl.graph import ImageGraph
+from ocisictl.models import AppConfig, AppContext, ContainerImage
+
+# name: the FROM line of its Containerfile
+CONTAINERFILES = {
+    'base': 'quay.io/fedora/fedora:43',
+    'up-to-date': 'base:latest',
+    'go': 'base:latest',
+    'zig': 'base:latest',
+    'zig-tools': 'zig:latest',
+    'python': 'base:latest',
+}
+
+
+@pytest.fixture
+def graph(tmp_path: Path) -> ImageGraph:
+    for name, parent in CONTAINERFILES.items():
+        (tmp_path / f'Containerfile.{name}').write_text(f'FROM {parent}\n\nRUN dnf install -y {name}\n')
+
+    return ImageGraph.from_images([ContainerImage(name=name, path=str(tmp_path), enabled=True) for name in CONTAINERFILES])
+
+
+@pytest.fixture
+def ctx(graph: ImageGraph, monkeypatch: pytest.MonkeyPatch) -> AppContext:
+    # the store: every image exists with digest sha256:<name>, and only up-to-date carries the current fingerprint
+    def image_id(manager: str, image_name: str, verbose: bool) -> Optional[str]:
+        return f'sha256:{image_name.removesuffix(":latest")}'
+
+    def image_label(manager: str, image_name: str, label: str, verbose: bool) -> Optional[str]:
+        return 'fingerprint' if image_name == 'up-to-date:latest' else 'outdated'
+
+    monkeypatch.setattr(steps, 'image_id', image_id)
+    monkeypatch.setattr(steps, 'image_label', image_label)
+    monkeypatch.setattr(steps, 'image_fingerprint', lambda ctx, image: 'fingerprint')
+
+    args = argparse.Namespace(verb='process', file='ocisictl.yaml', force=False, prune=False, verbose=False)
+    return AppContext(args=args, config=AppConfig(images=graph.images))
+
+
+def test_stale_images_without_checkpoints(ctx: AppContext, graph: ImageGraph) -> None:
+    # base is outdated, so every image is rebuilt - up-to-date too, as its parent is
+    assert steps.stale_images(ctx=ctx, graph=graph) == {f'{name}:latest' for name in CONTAINERFILES}
+
+
+def test_stale_images_keeps_every_checkpoint(ctx: AppContext, graph: ImageGraph) -> None:
+    # up-to-date is checked by its fingerprint before go, zig and zig-tools are - which must still be kept
+    built = {name: f'sha256:{name.removesuffix(":latest")}' for name in ('base:latest', 'go:latest', 'zig:latest', 'zig-tools:latest')}
+
+    assert steps.stale_images(ctx=ctx, graph=graph, built=built) == {'python:latest'}
+
+
+def test_stale_images_rebuilds_changed_checkpoints(ctx: AppContext, graph: ImageGraph) -> None:
+    # zig was rebuilt (or removed) since the interrupted run built it, so it and zig-tools are built again
+    built = {
+        'base:latest': 'sha256:base',
+        'go:latest': 'sha256:go',
+        'zig:latest': 'sha256:zig-before',
+        'zig-tools:latest': 'sha256:zig-tools',
+    }
+
+    assert steps.stale_images(ctx=ctx, graph=graph, built=built) == {'zig:latest', 'zig-tools:latest', 'python:latest'}
@@ -0,0 +1,41 @@
+"""Time how long ocisictl takes to start up - list --enabled, which only reads the (cached) config and prints a table.
+
+Run with `pytest --bench`. The test fails if the median of --startup-runs runs is over --startup-budget-ms, which is
+kept close to the current start up time so that e.g. a module imported by every verb instead of by the steps that use
+it is noticed.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.bench
+
+REPO = Path(__file__).resolve().parents[1]
+
+
+def test_startup(pytestconfig: pytest.Config, tmp_path: Path) -> None:
+    cmd = [sys.executable, '-m', 'ocisictl', 'list', '--enabled', '-f', str(REPO / 'ocisictl.yaml')]
+    env = {**os.environ, 'PYTHONPATH': str(REPO), 'XDG_CACHE_HOME': str(tmp_path / 'cache')}
+
+    def run() -> float:
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, env=env, cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if proc.returncode != 0:
+            pytest.fail(f'list --enabled: rc={proc.returncode}\n{proc.stderr[-2000:]}')
+
+        return elapsed
+
+    run()  # warm up - the first run also parses and caches the config, and compiles the modules
+    runs = [run() for _ in range(pytestconfig.getoption('--startup-runs'))]
+
+    median = statistics.median(runs)
+    budget = pytestconfig.getoption('--startup-budget-ms')
+    assert median <= budget, f'list --enabled: median {median:.1f}ms is over the {budget:.1f}ms budget (min {min(runs):.1f}ms)'
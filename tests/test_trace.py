@@ -0,0 +1,27 @@
+"""Spans are only kept while a run is traced - watch runs process over and over without --trace or --metrics"""
+
+from ocisictl import trace
+
+
+def test_spans_not_recorded_unless_started() -> None:
+    with trace.span('create image', image='fedora-go'):
+        pass
+
+    assert trace.spans() == []
+
+
+def test_spans_recorded_until_stopped() -> None:
+    trace.start()
+    try:
+        with trace.span('create image', image='fedora-go'):
+            with trace.span('podman build', cat='cmd') as s:
+                s.tags['exit_code'] = 0
+
+        assert [(s.name, s.image, s.exit_code) for s in trace.spans()] == [
+            ('create image', 'fedora-go', None),
+            ('podman build', 'fedora-go', 0),
+        ]
+    finally:
+        trace.stop()
+
+    assert trace.spans() == []